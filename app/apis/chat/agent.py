@@ -47,7 +47,7 @@ class QuestionAnswerAgent:
         """
         self.tools = [
             WebSearch().get(),
-            VectorStoreSearch(index_name=user_id).get()
+            HybridSearch(index_name=user_id).get()
         ]
 
     def _get_executor(self) -> AgentExecutor:
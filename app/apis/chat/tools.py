@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
 from langchain_core.tools import BaseTool
 from langchain_community.tools.tavily_search import TavilySearchResults
-from app.utils.vectorstore import load_vector_store_by_index
+from app.utils.vectorstore import load_vector_store_by_index, load_hybrid_retriever_by_index
 from langchain.tools.retriever import create_retriever_tool
 
 class Tool(ABC):
@@ -30,4 +30,17 @@ class VectorStoreSearch(Tool):
             vector_store.as_retriever(),
             name="knowledge_base_search",
             description="Search for relevant content in the local vector database"
+        )
+
+class HybridSearch(Tool):
+    """Drop-in replacement for `VectorStoreSearch` that also matches exact keywords."""
+
+    def __init__(self, index_name) -> None:
+        self.index_name = index_name
+
+    def get(self) -> BaseTool:
+        return create_retriever_tool(
+            load_hybrid_retriever_by_index(index_name=self.index_name),
+            name="knowledge_base_search",
+            description="Search for relevant content in the local knowledge base"
         )
\ No newline at end of file
@@ -0,0 +1,78 @@
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from app.db import database, models
+from .processors import WeChatArticleProcessor
+import asyncio, json, logging
+
+logger = logging.getLogger(__name__)
+
+ARTICLE_FIELDS = ("url", "title", "description", "thumbnail_url", "content")
+
+# Fetches in progress by url, so concurrent saves of the same url share one fetch.
+_inflight_fetches: Dict[str, asyncio.Future] = {}
+
+def _article_data(article: models.Article) -> dict:
+    data = {field: getattr(article, field) for field in ARTICLE_FIELDS}
+    data["summary"] = article.summary
+    return data
+
+async def _fetch_and_store(url: str, processor: WeChatArticleProcessor) -> dict:
+    data = await processor.run_async(url)
+    async with database.AsyncSessionLocal() as session:
+        session.add(models.Article(**{field: data.get(field) for field in ARTICLE_FIELDS}))
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Stored by another process in the meantime.
+            await session.rollback()
+    return data
+
+async def afetch_article(url: str, processor: Optional[WeChatArticleProcessor] = None) -> dict:
+    """
+    Returns the content and metadata of the url, with the cached summary if any.
+    The page is only fetched when no user has saved the url before.
+    """
+    async with database.AsyncSessionLocal() as session:
+        result = await session.execute(select(models.Article).filter(models.Article.url == url))
+        article = result.scalars().first()
+    if article is not None:
+        logger.info(f"Article cache hit. url = {url}")
+        return _article_data(article)
+    future = _inflight_fetches.get(url)
+    if future is None:
+        future = asyncio.ensure_future(_fetch_and_store(url, processor or WeChatArticleProcessor()))
+        _inflight_fetches[url] = future
+        future.add_done_callback(lambda _: _inflight_fetches.pop(url, None))
+    else:
+        logger.info(f"Joining in-flight fetch. url = {url}")
+    # Shielded, so a cancelled request does not cancel the fetch for the others.
+    data = await asyncio.shield(future)
+    return {**data, "summary": None}
+
+def get_article(url: str, session: Session) -> Optional[models.Article]:
+    return session.query(models.Article).filter(models.Article.url == url).first()
+
+def get_keywords(article: Optional[models.Article]) -> Optional[List[str]]:
+    if article is None or article.keywords is None:
+        return None
+    return json.loads(article.keywords)
+
+def save_enrichment(
+    url: str,
+    session: Session,
+    summary: Optional[str] = None,
+    keywords: Optional[List[str]] = None
+) -> None:
+    """
+    Stage the user independent enrichment of the url in the session,
+    it is committed together with the collection it was generated for.
+    """
+    article = get_article(url=url, session=session)
+    if article is None:
+        return
+    if summary and not article.summary:
+        article.summary = summary
+    if keywords and article.keywords is None:
+        article.keywords = json.dumps(keywords, ensure_ascii=False)
@@ -1,88 +1,401 @@
-from sqlalchemy.orm import Session, defer, joinedload
-from typing import List
-from ...db import models
+from sqlalchemy import JSON, and_, exists, func, or_, select, text
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, defer
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple, Type, Union
+import base64, html, json, os, threading
+from ...db import fulltext, models
+from ...db.counters import count_update
 from app.apis.collection import schemas
+from app.utils.lexical import SNIPPET_CLOSE, SNIPPET_OPEN, make_snippet
+
+# Users whose tag and category name -> id maps are kept in memory.
+NAME_INDEX_MAX_USERS = int(os.getenv("NAME_INDEX_MAX_USERS", 1024))
+# Characters of the search result snippets.
+SEARCH_SNIPPET_CHARS = int(os.getenv("SEARCH_SNIPPET_CHARS", 120))
 
 # Collection
+def encode_cursor(collection: Union[models.Collection, dict]) -> str:
+    """
+    Opaque position of a collection in the (created_at, id) listing order.
+    Takes a collection or a row of `get_collection_rows`.
+    """
+    if isinstance(collection, dict):
+        created_at, id_ = collection["created_at"], collection["id"]
+    else:
+        created_at, id_ = collection.created_at, collection.id
+    raw = json.dumps([created_at.isoformat(), id_])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), id_
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+def _paginate(query, cursor: Optional[str], limit: Optional[int]):
+    """
+    Order a collection query newest first and return the page after `cursor`.
+    Keyset pagination, so every page costs the same however deep it is.
+    """
+    if cursor:
+        created_at, id_ = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                models.Collection.created_at < created_at,
+                and_(models.Collection.created_at == created_at, models.Collection.id < id_)
+            )
+        )
+    query = query.order_by(models.Collection.created_at.desc(), models.Collection.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
 def get_collections(
     user_id: str,
     session: Session,
-    exclude_fields: List[str] = []
+    exclude_fields: List[str] = [],
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
 ):
     options = [defer(getattr(models.Collection, field)) for field in exclude_fields]
-    return session.query(models.Collection)\
+    query = session.query(models.Collection)\
         .filter(
             models.Collection.user_id == user_id
         )\
-        .options(*options)\
-        .all()
+        .options(*options)
+    return _paginate(query, cursor, limit).all()
+
+# Aggregate functions collecting the tag names of a collection into a JSON array.
+JSON_ARRAY_AGGREGATES = {
+    "sqlite": func.json_group_array,
+    "postgresql": func.json_agg,
+    "mysql": func.json_arrayagg,
+    "mariadb": func.json_arrayagg
+}
 
-def get_collections_by_category(
+def get_collection_rows(
     user_id: str,
-    category_id: str,
     session: Session,
-    exclude_fields: List[str] = []
-):
-    options = [defer(getattr(models.Collection, field)) for field in exclude_fields]
-    return session.query(models.Collection) \
-        .filter(
-            models.Collection.user_id == user_id,
-            models.Collection.category_id == category_id
-        ) \
-        .options(*options) \
-        .all()
+    category_id: Optional[str] = None,
+    tag_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
+) -> List[dict]:
+    """
+    Listing fields of the user's collections as plain dicts, without building ORM
+    objects. The category name is joined and the tag names are aggregated in SQL.
+    """
+    json_array_agg = JSON_ARRAY_AGGREGATES[session.get_bind().dialect.name]
+    tag_names = select(json_array_agg(models.Tag.name, type_=JSON)) \
+        .select_from(models.collections_tags) \
+        .join(models.Tag, models.Tag.id == models.collections_tags.c.tag_id) \
+        .filter(models.collections_tags.c.collection_id == models.Collection.id) \
+        .scalar_subquery()
+    query = select(
+        models.Collection.id,
+        models.Collection.url,
+        models.Collection.title,
+        models.Collection.description,
+        models.Collection.thumbnail_url,
+        models.Collection.summary,
+        models.Collection.created_at,
+        models.Category.name.label("category"),
+        tag_names.label("tags")
+    ) \
+        .outerjoin(models.Category, models.Category.id == models.Collection.category_id) \
+        .filter(models.Collection.user_id == user_id)
+    if category_id:
+        query = query.filter(models.Collection.category_id == category_id)
+    if tag_id:
+        query = query.filter(
+            exists().where(
+                models.collections_tags.c.collection_id == models.Collection.id,
+                models.collections_tags.c.tag_id == tag_id
+            )
+        )
+    rows = session.execute(_paginate(query, cursor, limit)).mappings().all()
+    # Aggregates over no rows are NULL in some databases.
+    return [{**row, "tags": [name for name in row["tags"] or [] if name is not None]} for row in rows]
 
-def get_collections_by_tag(
+def _encode_search_cursor(score: float, position: int) -> str:
+    raw = json.dumps([score, position])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        score, position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(score), int(position)
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+def _snippet_html(row, query: str) -> str:
+    snippet = make_snippet([row.description, row.summary, row.content], query, SEARCH_SNIPPET_CHARS)
+    return html.escape(snippet).replace(SNIPPET_OPEN, "<mark>").replace(SNIPPET_CLOSE, "</mark>")
+
+def search_collections(
     user_id: str,
-    tag_id: str,
+    query: str,
     session: Session,
-    exclude_fields: List[str] = []
-):
-    field_defer_option = [defer(getattr(models.Collection, field)) for field in exclude_fields]
-    collections = session.query(models.Collection) \
-        .join(models.Collection.tags) \
-        .filter(
-            models.Tag.user_id == user_id,
-            models.Tag.id == tag_id
-        ) \
-        .options(
-            joinedload(models.Collection.tags),
-            *field_defer_option
-        ) \
-        .all()
-    return collections
+    cursor: Optional[str] = None,
+    limit: int = 20
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Full-text search of the user's collections, best match first by bm25.
+    Returns the page of results and the cursor of the next one. Results hold
+    the listing fields, the score and an HTML snippet with the matches in
+    <mark> tags. Only the collections of the page are read.
+    """
+    if session.get_bind().dialect.name != "sqlite":
+        raise NotImplementedError("Search requires SQLite.")
+    match = fulltext.match_query(user_id, query)
+    if not match:
+        return [], None
+    # One extra row tells whether there is a next page.
+    params = {"match": match, "limit": limit + 1}
+    after_cursor = ""
+    if cursor:
+        params["score"], params["position"] = _decode_search_cursor(cursor)
+        after_cursor = f"AND ({fulltext.bm25()} > :score OR ({fulltext.bm25()} = :score AND rowid > :position))"
+    statement = text(f"""
+        WITH page AS (
+            SELECT rowid AS position, {fulltext.bm25()} AS score
+            FROM {fulltext.FTS_TABLE}
+            WHERE {fulltext.FTS_TABLE} MATCH :match {after_cursor}
+            ORDER BY score, position
+            LIMIT :limit
+        )
+        SELECT c.id, c.url, c.title, c.description, c.thumbnail_url, c.summary, c.content, c.created_at,
+            page.score, page.position
+        FROM page
+        JOIN collections AS c ON c.rowid = page.position
+        ORDER BY page.score, page.position
+    """).columns(created_at=models.Collection.created_at.type)
+    rows = session.execute(statement, params).all()
+    next_cursor = _encode_search_cursor(rows[limit - 1].score, rows[limit - 1].position) if len(rows) > limit else None
+    items = [
+        {
+            "id": row.id,
+            "url": row.url,
+            "title": row.title,
+            "description": row.description,
+            "thumbnail_url": row.thumbnail_url,
+            "summary": row.summary,
+            "created_at": row.created_at,
+            "score": row.score,
+            "snippet": _snippet_html(row, query)
+        }
+        for row in rows[:limit]
+    ]
+    return items, next_cursor
 
 def get_collection_by_id(id_: str, session: Session):
     return models.Collection.get(session=session, id_=id_)
 
-def get_collection_by_url(
+def _count_releases(collection: models.Collection):
+    """Count updates for the category and tags a collection leaves."""
+    statements = []
+    if collection.category_id:
+        statements.append(count_update(models.Category, [collection.category_id], -1))
+    if collection.tags:
+        statements.append(count_update(models.Tag, [tag.id for tag in collection.tags], -1))
+    return statements
+
+def delete_collection(collection: models.Collection, session: Session):
+    """
+    Delete the collection together with its tag links and podcast in one commit.
+    Returns the podcast audio file path, if any, so the caller can remove it.
+    """
+    podcast = collection.podcast
+    audio_file_path = podcast.file_path if podcast else None
+    for statement in _count_releases(collection):
+        session.execute(statement)
+    collection.tags.clear()
+    session.delete(collection)
+    if podcast:
+        session.delete(podcast)
+    session.commit()
+    return audio_file_path
+
+async def aget_collection_by_id(id_: str, session: AsyncSession):
+    return await models.Collection.aget(session=session, id_=id_)
+
+async def aget_collection_by_url(
     user_id: str,
     url: str,
-    session: Session
+    session: AsyncSession
 ):
-    return session.query(models.Collection) \
+    result = await session.execute(
+        select(models.Collection)
         .filter(
             models.Collection.user_id == user_id,
             models.Collection.url == url
-        ) \
-        .first()
+        )
+        .limit(1)
+    )
+    return result.scalars().first()
 
-def create_collection(data: schemas.CollectionCreate, session: Session):
-    return models.Collection(**data.dict()).save(session)
+async def acreate_collection(data: schemas.CollectionCreate, session: AsyncSession):
+    return await models.Collection(**data.dict()).asave(session)
 
-# Tag
-def get_tags(user_id: str, session: Session):
-    return session.query(models.Tag) \
+async def aget_existing_urls(user_id: str, urls: List[str], session: AsyncSession) -> Set[str]:
+    """Returns the subset of `urls` the user has already collected."""
+    if not urls:
+        return set()
+    result = await session.execute(
+        select(models.Collection.url)
         .filter(
-            models.Tag.user_id == user_id
-        )\
-        .options(joinedload(models.Tag.collections)) \
-        .all()
+            models.Collection.user_id == user_id,
+            models.Collection.url.in_(urls)
+        )
+    )
+    return set(result.scalars().all())
 
+async def aadd_collections(data: List[schemas.CollectionCreate], session: AsyncSession):
+    """
+    Add several collections in one flush without committing,
+    so the caller can commit them together with related rows.
+    """
+    collections = [models.Collection(**item.dict()) for item in data]
+    session.add_all(collections)
+    await session.flush()
+    return collections
+
+# Tag
+def get_tag_overview(user_id: str, session: Session) -> List[dict]:
+    """Tags of the user with their number of collections."""
+    rows = session.execute(
+        select(models.Tag.id, models.Tag.name, models.Tag.collection_count)
+        .filter(models.Tag.user_id == user_id)
+    ).all()
+    return [
+        {"id": id_, "name": name, "collection_count": count}
+        for id_, name, count in rows
+    ]
 
 # Category
-def get_user_categories(user_id: str, session: Session):
-    return session.query(models.Category) \
-        .filter(models.Category.user_id == user_id) \
-        .options(joinedload(models.Category.collections)) \
-        .all()
\ No newline at end of file
+def get_category_overview(user_id: str, session: Session) -> List[dict]:
+    """Categories of the user with their number of collections."""
+    rows = session.execute(
+        select(
+            models.Category.id,
+            models.Category.name,
+            models.Category.description,
+            models.Category.collection_count
+        )
+        .filter(models.Category.user_id == user_id)
+    ).all()
+    return [
+        {"id": id_, "name": name, "description": description, "collection_count": count}
+        for id_, name, description, count in rows
+    ]
+
+# Tag and category names
+def insert_ignore(session: Session, table, rows: List[dict]) -> None:
+    """
+    Insert the rows with a single multi-row INSERT ... VALUES (...), (...),
+    skipping rows that conflict with a unique constraint.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(table).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        statement = sqlite.insert(table).on_conflict_do_nothing()
+    elif dialect in ("mysql", "mariadb"):
+        statement = mysql.insert(table).prefix_with("IGNORE")
+    else:
+        raise NotImplementedError(f"insert_ignore is not supported for {dialect}.")
+    session.execute(statement.values(rows))
+
+class UserNameIndex:
+    """
+    Per-user name -> id maps of a model with a unique (user_id, name),
+    loaded with one query and kept for the most recently used users.
+    """
+
+    def __init__(self, model: Type[Union[models.Tag, models.Category]], max_users: int) -> None:
+        self.model = model
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._maps: OrderedDict[str, Dict[str, str]] = OrderedDict()
+
+    def get(self, session: Session, user_id: str) -> Dict[str, str]:
+        with self._lock:
+            if user_id in self._maps:
+                self._maps.move_to_end(user_id)
+                return self._maps[user_id]
+        rows = session.execute(
+            select(self.model.name, self.model.id).filter(self.model.user_id == user_id)
+        ).all()
+        name_to_id = {name: id_ for name, id_ in rows}
+        with self._lock:
+            self._maps[user_id] = name_to_id
+            while len(self._maps) > self.max_users:
+                self._maps.popitem(last=False)
+        return name_to_id
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._maps.pop(user_id, None)
+
+    def resolve(
+        self,
+        session: Session,
+        user_id: str,
+        names: List[str],
+        values: Optional[Dict[str, dict]] = None
+    ) -> Dict[str, str]:
+        """
+        Map names to ids, inserting the missing ones with a single statement.
+        `values` holds extra column values of new rows by name. The inserts
+        are committed by the caller.
+        """
+        names = list(dict.fromkeys(names))
+        name_to_id = self.get(session=session, user_id=user_id)
+        missing = [name for name in names if name not in name_to_id]
+        if not missing:
+            return {name: name_to_id[name] for name in names}
+        insert_ignore(session, self.model.__table__, [
+            {"name": name, "user_id": user_id, **(values or {}).get(name, {})}
+            for name in missing
+        ])
+        # Not cached until committed, the transaction could still roll back.
+        self.invalidate(user_id)
+        rows = session.execute(
+            select(self.model.name, self.model.id).filter(
+                self.model.user_id == user_id,
+                self.model.name.in_(missing)
+            )
+        ).all()
+        return {**{name: name_to_id[name] for name in names if name in name_to_id}, **dict(rows)}
+
+tag_names = UserNameIndex(models.Tag, max_users=NAME_INDEX_MAX_USERS)
+category_names = UserNameIndex(models.Category, max_users=NAME_INDEX_MAX_USERS)
+
+def add_collection_tags(collection_id: str, tag_ids: List[str], session: Session) -> None:
+    """Link the collection to the tags and count the new links, committed by the caller."""
+    linked_ids = set(session.execute(
+        select(models.collections_tags.c.tag_id).filter(
+            models.collections_tags.c.collection_id == collection_id,
+            models.collections_tags.c.tag_id.in_(tag_ids)
+        )
+    ).scalars().all())
+    new_ids = [tag_id for tag_id in dict.fromkeys(tag_ids) if tag_id not in linked_ids]
+    if new_ids:
+        insert_ignore(session, models.collections_tags, [
+            {"collection_id": collection_id, "tag_id": tag_id} for tag_id in new_ids
+        ])
+        session.execute(count_update(models.Tag, new_ids, 1))
+
+def set_collection_category(collection: models.Collection, category_id: Optional[str], session: Session) -> None:
+    """Move the collection to another category and update both counts, committed by the caller."""
+    if collection.category_id == category_id:
+        return
+    if collection.category_id:
+        session.execute(count_update(models.Category, [collection.category_id], -1))
+    if category_id:
+        session.execute(count_update(models.Category, [category_id], 1))
+    collection.category_id = category_id
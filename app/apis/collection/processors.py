@@ -1,20 +1,203 @@
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, Browser, Page, Playwright, Route
+from selectolax.lexbor import LexborHTMLParser
 from abc import ABC, abstractmethod
-import logging
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+import asyncio, logging, os, httpx
 
 logger = logging.getLogger(__name__)
 
+# Pages opened concurrently across the pool.
+BROWSER_POOL_MAX_CONCURRENCY = int(os.getenv("BROWSER_POOL_MAX_CONCURRENCY", 4))
+# A browser is replaced after serving this many pages, to bound its memory growth.
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", 100))
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+STATIC_FETCH_TIMEOUT = float(os.getenv("STATIC_FETCH_TIMEOUT", 10))
+USER_AGENT = (
+  "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+  "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+)
+
+# Pooled client for the static fast path; closed in the app lifespan.
+http_client = httpx.AsyncClient(
+  timeout=STATIC_FETCH_TIMEOUT,
+  follow_redirects=True,
+  headers={"User-Agent": USER_AGENT},
+  limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+)
+# Number of articles served by each extraction path ("static" or "browser"), and
+# of static fetches with an empty article body ("static_empty"), which fall back
+# to the browser.
+fetch_path_counts: Counter = Counter()
+
+async def _block_heavy_resources(route: Route):
+  if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+    await route.abort()
+  else:
+    await route.continue_()
+
+@dataclass
+class _BrowserSlot:
+  browser: Browser
+  pages_served: int = 0
+  active_pages: int = 0
+  retired: bool = False
+
+class BrowserPool:
+  """
+  Long-lived headless Chromium shared by all requests. Each page gets its own
+  browser context, so cookies and storage are isolated. Browsers are recycled
+  after `max_pages` pages or when they crash.
+  """
+
+  def __init__(self, max_concurrency: int, max_pages: int) -> None:
+    self.max_concurrency = max_concurrency
+    self.max_pages = max_pages
+    self._playwright: Optional[Playwright] = None
+    self._current: Optional[_BrowserSlot] = None
+    self._retiring: List[_BrowserSlot] = []
+    self._semaphore = asyncio.Semaphore(max_concurrency)
+    self._lock = asyncio.Lock()
+
+  async def start(self):
+    async with self._lock:
+      if self._playwright is None:
+        self._playwright = await async_playwright().start()
+        logger.info("Browser pool started.")
+
+  async def stop(self):
+    # Retired browsers still serving a page are closed too.
+    slots = self._retiring + ([self._current] if self._current else [])
+    for slot in slots:
+      await self._close_browser(slot)
+    self._current = None
+    self._retiring = []
+    if self._playwright:
+      await self._playwright.stop()
+      self._playwright = None
+      logger.info("Browser pool stopped.")
+
+  @asynccontextmanager
+  async def page(self) -> AsyncIterator[Page]:
+    await self.start()
+    async with self._semaphore:
+      slot = await self._acquire_browser()
+      slot.active_pages += 1
+      context = None
+      try:
+        context = await slot.browser.new_context()
+        await context.route("**/*", _block_heavy_resources)
+        yield await context.new_page()
+      finally:
+        if context is not None and slot.browser.is_connected():
+          await context.close()
+        slot.active_pages -= 1
+        slot.pages_served += 1
+        await self._release_browser(slot)
+
+  async def _acquire_browser(self) -> _BrowserSlot:
+    async with self._lock:
+      slot = self._current
+      if slot and slot.browser.is_connected() and slot.pages_served + slot.active_pages < self.max_pages:
+        return slot
+      if slot:
+        self._retire(slot)
+        if slot.active_pages == 0:
+          await self._close_browser(slot)
+      browser = await self._playwright.chromium.launch(headless=True)
+      self._current = _BrowserSlot(browser=browser)
+      return self._current
+
+  async def _release_browser(self, slot: _BrowserSlot):
+    if not slot.browser.is_connected() and slot is self._current:
+      logger.warning("Browser disconnected, it will be replaced.")
+      self._retire(slot)
+    elif slot.pages_served >= self.max_pages:
+      # Closed as soon as its last page is done, not when the next page needs a browser.
+      self._retire(slot)
+    if slot.retired and slot.active_pages == 0:
+      await self._close_browser(slot)
+
+  def _retire(self, slot: _BrowserSlot):
+    slot.retired = True
+    if slot is self._current:
+      self._current = None
+    if slot not in self._retiring:
+      self._retiring.append(slot)
+
+  async def _close_browser(self, slot: _BrowserSlot):
+    if slot in self._retiring:
+      self._retiring.remove(slot)
+    try:
+      if slot.browser.is_connected():
+        await slot.browser.close()
+    except Exception as e:
+      logger.warning(f"Failed to close browser, error: {e}")
+
+browser_pool = BrowserPool(
+  max_concurrency=BROWSER_POOL_MAX_CONCURRENCY,
+  max_pages=BROWSER_MAX_PAGES
+)
+
 class BaseProcessor(ABC):
   @abstractmethod
   async def run_async(self, url) -> dict:
     pass
 
 class WeChatArticleProcessor(BaseProcessor):
+  """
+  Extracts WeChat articles from the server-rendered HTML when possible and
+  falls back to a headless browser when the expected elements are missing.
+  """
+
+  def __init__(self, pool: BrowserPool = browser_pool, client: httpx.AsyncClient = http_client) -> None:
+    self.pool = pool
+    self.client = client
+
   async def run_async(self, url) -> dict:
-    async with async_playwright() as playwright:
-      logger.info("Start processing...")
-      browser = await playwright.chromium.launch(headless=True)
-      page = await browser.new_page()
+    logger.info("Start processing...")
+    try:
+      data = await self._run_static(url)
+    except httpx.HTTPError as e:
+      logger.warning(f"Static fetch failed, url = {url}, error: {e}")
+      data = None
+    path = "static"
+    if data is None:
+      data = await self._run_browser(url)
+      path = "browser"
+    fetch_path_counts[path] += 1
+    logger.info(f'Extract content and metadata: DONE. path = {path}, url = {url}')
+    return data
+
+  async def _run_static(self, url) -> Optional[dict]:
+    response = await self.client.get(url)
+    response.raise_for_status()
+    tree = LexborHTMLParser(response.text)
+    meta = {}
+    for name in ("og:title", "og:description", "og:image"):
+      node = tree.css_first(f'meta[property="{name}"]')
+      meta[name] = node.attributes.get("content") if node else None
+    content_node = tree.css_first(".rich_media_content")
+    if not meta["og:title"] or content_node is None:
+      return None
+    content = content_node.text(deep=True)
+    if not content.strip():
+      # Rendered by scripts, or an anti-bot page.
+      fetch_path_counts["static_empty"] += 1
+      logger.info(f"Static fetch has an empty article body, url = {url}")
+      return None
+    return {
+      "url": url,
+      "title": meta["og:title"],
+      "description": meta["og:description"],
+      "thumbnail_url": meta["og:image"],
+      "content": content
+    }
+
+  async def _run_browser(self, url) -> dict:
+    async with self.pool.page() as page:
       await page.goto(url)
       
       title_element = await page.query_selector('meta[property="og:title"]')
@@ -29,8 +212,6 @@ class WeChatArticleProcessor(BaseProcessor):
       full_text_element = await page.query_selector(".rich_media_content")
       full_text = await full_text_element.text_content()
 
-      await browser.close()
-      logger.info('Extract content and metadata: DONE')
       return {
         "url": url,
         "title": title,
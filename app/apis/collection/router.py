@@ -1,17 +1,43 @@
-from fastapi import APIRouter, BackgroundTasks, Query, Depends, status, HTTPException
-from typing import Optional
+from fastapi import APIRouter, Query, Depends, status, HTTPException
+from fastapi.responses import ORJSONResponse
+from typing import List, Optional
 from app.apis.collection import crud
 from app.apis.schemas import BaseResponse
 from app.apis.dependencies import get_current_user
-from .schemas import AddCollectionBody, DeleteCollectionBody, CollectionCreate
+from .schemas import AddCollectionBody, DeleteCollectionBody, CollectionCreate, ImportCollectionsBody
 from app.utils import vectorstore, tools as Tools
-from .processors import WeChatArticleProcessor
-import re, logging
+from app.utils.jobs import aenqueue_jobs, update_job_progress, worker_pool
+from . import content_cache
+import re, logging, os, enum, asyncio, json, uuid
 from app.db import database, models
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
+AUDIO_DIR = 'app/public/audio'
+
+class EnrichmentMode(str, enum.Enum):
+    # summary, tags and category from a single model call
+    COMBINED = "combined"
+    # one model call per field
+    SEPARATE = "separate"
+
+ENRICHMENT_MODE = EnrichmentMode(os.getenv("ENRICHMENT_MODE", EnrichmentMode.COMBINED.value))
+# Number of workers per enrichment job type.
+TAGS_JOB_CONCURRENCY = int(os.getenv("TAGS_JOB_CONCURRENCY", 2))
+SUMMARY_JOB_CONCURRENCY = int(os.getenv("SUMMARY_JOB_CONCURRENCY", 2))
+ENRICHMENT_JOB_CONCURRENCY = int(os.getenv("ENRICHMENT_JOB_CONCURRENCY", 1))
+CATEGORY_JOB_CONCURRENCY = int(os.getenv("CATEGORY_JOB_CONCURRENCY", 1))
+VECTOR_STORE_JOB_CONCURRENCY = int(os.getenv("VECTOR_STORE_JOB_CONCURRENCY", 2))
+IMPORT_JOB_CONCURRENCY = int(os.getenv("IMPORT_JOB_CONCURRENCY", 1))
+# Bulk import limits: urls per request, concurrent fetches per import and rows per insert.
+IMPORT_MAX_URLS = int(os.getenv("IMPORT_MAX_URLS", 1000))
+IMPORT_FETCH_CONCURRENCY = int(os.getenv("IMPORT_FETCH_CONCURRENCY", 4))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 50))
+IMPORT_JOB_TYPE = "import_collections"
+COLLECTION_PAGE_SIZE = int(os.getenv("COLLECTION_PAGE_SIZE", 20))
+COLLECTION_PAGE_MAX_SIZE = 100
 
 def is_wechat_article(url) -> bool:
     """
@@ -22,31 +48,39 @@ def is_wechat_article(url) -> bool:
         return True
     return False
 
+def save_category(session: Session, collection: models.Collection, name: str, description: Optional[str]):
+    """Point the collection at the user's category `name`, creating it if needed."""
+    category_ids = crud.category_names.resolve(
+        session=session,
+        user_id=collection.user_id,
+        names=[name],
+        values={name: {"description": description}}
+    )
+    crud.set_collection_category(collection=collection, category_id=category_ids[name], session=session)
+
+def save_tags(session: Session, collection: models.Collection, names: List[str]):
+    """Link the collection to the user's tags `names`, creating the missing ones."""
+    tag_ids = crud.tag_names.resolve(session=session, user_id=collection.user_id, names=names)
+    crud.add_collection_tags(collection_id=collection.id, tag_ids=list(tag_ids.values()), session=session)
+
+def get_category_names(session: Session, user_id: str) -> List[str]:
+    return list(crud.category_names.get(session=session, user_id=user_id))
+
 def generate_and_save_category(collection_id: str, session: Session):
     logger.info("generate_and_save_category")
     collection = crud.get_collection_by_id(id_=collection_id, session=session)
     if not collection:
         raise ValueError("Collection not found.")
-    categories = crud.get_user_categories(session=session, user_id=collection.user_id)
-    if not categories:
-        category_names = []
-    else:
-        category_names = list(map(lambda x: x.name, categories))
+    category_names = get_category_names(session=session, user_id=collection.user_id)
     response = Tools.classification_tool(collection.content, category_names)
     try:
         category_name = response["name"]
-        category_desc = response["description"]
-        category = session.query(models.Category).filter(
-            models.Category.name == category_name,
-            models.Category.user_id == collection.user_id
-        ).first()
-        if not category:
-            category = models.Category(
-                name=category_name,
-                description=category_desc,
-                user_id=collection.user_id
-            ).save(session=session)
-        collection.category_id = category.id
+        save_category(
+            session=session,
+            collection=collection,
+            name=category_name,
+            description=response["description"]
+        )
         session.commit()
         logger.info(f"generate_category done. category = {category_name}")
     except Exception as e:
@@ -57,25 +91,16 @@ def generate_and_save_tags(collection_id: str, session: Session):
     collection = crud.get_collection_by_id(id_=collection_id, session=session)
     if not collection:
         raise ValueError("Collection not found.")
-    response = Tools.tagging_tool(collection.content)
-    try:
+    article = content_cache.get_article(url=collection.url, session=session)
+    tag_names = content_cache.get_keywords(article)
+    if tag_names is None:
+        response = Tools.tagging_tool(collection.content)
         tag_names = response.get("tags", None)
+    try:
         if not tag_names:
             return
-        tags = []
-        for name in tag_names:
-            tag = session.query(models.Tag).filter(
-                models.Tag.name == name,
-                models.Tag.user_id == collection.user_id
-            ).first()
-            if not tag:
-                tag = models.Tag(
-                    name=name,
-                    user_id=collection.user_id
-                )
-                session.add(tag)
-            tags.append(tag)
-        collection.tags.extend(tags)
+        content_cache.save_enrichment(url=collection.url, session=session, keywords=tag_names)
+        save_tags(session=session, collection=collection, names=tag_names)
         session.commit()
         logger.info(f"generate_tags, done. tags = {tag_names}")
     except Exception as e:
@@ -86,19 +111,70 @@ def generate_and_save_summary(collection_id: str, session: Session):
     collection = crud.get_collection_by_id(id_=collection_id, session=session)
     if not collection:
         raise ValueError("Collection not found.")
-    summary = Tools.summary_tool(collection.content)
+    article = content_cache.get_article(url=collection.url, session=session)
+    if article and article.summary:
+        summary = article.summary
+    else:
+        summary = Tools.summary_tool(collection.content)
     if summary:
         collection.summary = summary
+        content_cache.save_enrichment(url=collection.url, session=session, summary=summary)
         session.commit()
     logger.info(f"summary = {summary}")
 
-def save_to_vector_store(collection_id: str, session: Session):
+def generate_and_save_enrichment(collection_id: str, session: Session):
+    """Generate summary, tags and category with one model call and save them in one transaction."""
+    logger.info("generate_and_save_enrichment")
     collection = crud.get_collection_by_id(id_=collection_id, session=session)
     if not collection:
         raise ValueError("Collection not found.")
+    category_names = get_category_names(session=session, user_id=collection.user_id)
+    article = content_cache.get_article(url=collection.url, session=session)
+    cached_keywords = content_cache.get_keywords(article)
+    if article and article.summary and cached_keywords is not None:
+        # Only the category depends on the user.
+        classification = Tools.classification_tool(collection.content, category_names)
+        response = {
+            "summary": article.summary,
+            "tags": cached_keywords,
+            "category_name": classification.get("name"),
+            "category_description": classification.get("description")
+        }
+    else:
+        response = Tools.enrichment_tool(collection.content, category_names)
+    try:
+        if response.get("summary"):
+            collection.summary = response["summary"]
+        tag_names = response.get("tags") or []
+        content_cache.save_enrichment(
+            url=collection.url,
+            session=session,
+            summary=response.get("summary"),
+            keywords=tag_names
+        )
+        save_tags(session=session, collection=collection, names=tag_names)
+        if response.get("category_name"):
+            save_category(
+                session=session,
+                collection=collection,
+                name=response["category_name"],
+                description=response.get("category_description")
+            )
+        session.commit()
+        logger.info(f"generate_enrichment done. tags = {tag_names}, category = {response.get('category_name')}")
+    except Exception as e:
+        session.rollback()
+        logger.error(f"generate_enrichment failed, error: {e}")
+
+async def save_to_vector_store(collection_id: str, session: AsyncSession):
+    collection = await crud.aget_collection_by_id(id_=collection_id, session=session)
+    if not collection:
+        # Deleted while the job was queued, there is nothing to index.
+        logger.info(f"Skip saving to vector store, collection deleted. collection_id = {collection_id}")
+        return
     if collection.content:
         logger.info(f"Saving content to vector store. url = {collection.url}, user_id = {collection.user_id}")
-        vectorstore.save_content_to_index(
+        await vectorstore.asave_content_to_index(
             content=collection.content,
             index_name=collection.user_id,
             metadata={
@@ -106,13 +182,104 @@ def save_to_vector_store(collection_id: str, session: Session):
                 "source": collection.url
             }
         )
+        # A deletion during the embedding found no vectors to tombstone, do it now.
+        # Closing ends the read transaction, the loaded collection stays readable.
+        await session.close()
+        if not await crud.aget_collection_by_id(id_=collection_id, session=session):
+            await asyncio.to_thread(
+                vectorstore.delete_content_from_index,
+                index_name=collection.user_id,
+                content_id=collection.id
+            )
         logger.info(f"Save content to vector store, Done. url = {collection.url}")
 
+# Concurrent category jobs of a user can't create the same category twice,
+# names are inserted with insert_ignore against a unique (user_id, name).
+if ENRICHMENT_MODE == EnrichmentMode.COMBINED:
+    ENRICHMENT_JOBS = {
+        "generate_enrichment": (generate_and_save_enrichment, ENRICHMENT_JOB_CONCURRENCY),
+        "save_to_vector_store": (save_to_vector_store, VECTOR_STORE_JOB_CONCURRENCY)
+    }
+else:
+    ENRICHMENT_JOBS = {
+        "generate_tags": (generate_and_save_tags, TAGS_JOB_CONCURRENCY),
+        "generate_summary": (generate_and_save_summary, SUMMARY_JOB_CONCURRENCY),
+        "generate_category": (generate_and_save_category, CATEGORY_JOB_CONCURRENCY),
+        "save_to_vector_store": (save_to_vector_store, VECTOR_STORE_JOB_CONCURRENCY)
+    }
+for job_type, (handler, concurrency) in ENRICHMENT_JOBS.items():
+    worker_pool.register(job_type, handler, concurrency=concurrency)
+
+def enrichment_jobs(collection_id: str):
+    return [
+        (job_type, f"{job_type}:{collection_id}", {"collection_id": collection_id})
+        for job_type in ENRICHMENT_JOBS
+    ]
+
+async def enqueue_enrichment_jobs(collection_id: str, session: AsyncSession):
+    await aenqueue_jobs(session=session, jobs=enrichment_jobs(collection_id))
+
+async def import_collections(user_id: str, urls: List[str], session: AsyncSession, job_id: str):
+    """
+    Fetch and save the given urls, skipping the ones the user already has.
+    Collections are inserted in batches, each committed together with its
+    enrichment jobs and the import progress.
+    """
+    existing_urls = await crud.aget_existing_urls(user_id=user_id, urls=urls, session=session)
+    pending_urls = [url for url in urls if url not in existing_urls]
+    progress = {
+        "total": len(urls),
+        "skipped": len(existing_urls),
+        "imported": 0,
+        "failed": 0,
+        "failed_urls": []
+    }
+    await update_job_progress(session=session, job_id=job_id, progress=progress)
+    await session.commit()
+    semaphore = asyncio.Semaphore(IMPORT_FETCH_CONCURRENCY)
+
+    async def fetch(url: str):
+        async with semaphore:
+            try:
+                return url, await content_cache.afetch_article(url)
+            except Exception as e:
+                logger.warning(f"Import fetch failed, url = {url}, error: {e}")
+                return url, None
+
+    async def flush(batch: List[CollectionCreate]):
+        collections = await crud.aadd_collections(data=batch, session=session)
+        progress["imported"] += len(collections)
+        await update_job_progress(session=session, job_id=job_id, progress=progress)
+        # Commits the collections, their enrichment jobs and the progress together.
+        await aenqueue_jobs(
+            session=session,
+            jobs=[job for collection in collections for job in enrichment_jobs(collection.id)]
+        )
+
+    batch = []
+    for next_result in asyncio.as_completed([fetch(url) for url in pending_urls]):
+        url, data = await next_result
+        if data is None:
+            progress["failed"] += 1
+            progress["failed_urls"].append(url)
+            continue
+        batch.append(CollectionCreate(**data, user_id=user_id))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    else:
+        await update_job_progress(session=session, job_id=job_id, progress=progress)
+        await session.commit()
+    logger.info(f"Import done. user_id = {user_id}, progress = {progress}")
+
+worker_pool.register(IMPORT_JOB_TYPE, import_collections, concurrency=IMPORT_JOB_CONCURRENCY)
+
 @router.post("/collection/add", response_model=BaseResponse)
 async def add_collection(
     body: AddCollectionBody,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(database.get_db_session),
+    db: AsyncSession = Depends(database.get_async_db_session),
     current_user: models.User = Depends(get_current_user)
 ):
     if not is_wechat_article(body.url):
@@ -121,8 +288,7 @@ async def add_collection(
             detail="Content not support."
         )
     url = body.url
-    processor = WeChatArticleProcessor()
-    item = crud.get_collection_by_url(
+    item = await crud.aget_collection_by_url(
         user_id=current_user.id,
         url=url,
         session=db
@@ -133,86 +299,194 @@ async def add_collection(
             detail="Content already exists."
         )
     else:
-        data = await processor.run_async(url)
-        new_collection = crud.create_collection(
+        data = await content_cache.afetch_article(url)
+        new_collection = await crud.acreate_collection(
             data=CollectionCreate(**data, user_id=current_user.id),
             session=db
         )
-        background_tasks.add_task(generate_and_save_tags, new_collection.id, db)
-        background_tasks.add_task(generate_and_save_summary, new_collection.id, db)
-        background_tasks.add_task(generate_and_save_category, new_collection.id, db)
-        background_tasks.add_task(save_to_vector_store, new_collection.id, db)
+        await enqueue_enrichment_jobs(collection_id=new_collection.id, session=db)
         return BaseResponse(
             code=status.HTTP_200_OK,
             msg='success'
         )
 
+@router.post("/collection/import", response_model=BaseResponse)
+async def import_collection_urls(
+    body: ImportCollectionsBody,
+    db: AsyncSession = Depends(database.get_async_db_session),
+    current_user: models.User = Depends(get_current_user)
+):
+    urls = list(dict.fromkeys(url.strip() for url in body.urls))
+    if not urls or len(urls) > IMPORT_MAX_URLS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Between 1 and {IMPORT_MAX_URLS} urls are allowed."
+        )
+    unsupported_urls = [url for url in urls if not is_wechat_article(url)]
+    if unsupported_urls:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Content not support: {unsupported_urls[:10]}"
+        )
+    job = await models.Job(
+        type=IMPORT_JOB_TYPE,
+        key=f"{IMPORT_JOB_TYPE}:{uuid.uuid4()}",
+        payload=json.dumps({"user_id": current_user.id, "urls": urls})
+    ).asave(db)
+    worker_pool.notify()
+    return BaseResponse(
+        code=status.HTTP_200_OK,
+        msg='success',
+        data={"job_id": job.id}
+    )
+
+@router.get("/collection/import/{job_id}", response_model=BaseResponse)
+async def get_import_progress(
+    job_id: str,
+    db: AsyncSession = Depends(database.get_async_db_session),
+    current_user: models.User = Depends(get_current_user)
+):
+    job = await models.Job.aget(session=db, id_=job_id)
+    if not job or job.type != IMPORT_JOB_TYPE or json.loads(job.payload)["user_id"] != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Import job not found."
+        )
+    return BaseResponse(
+        code=status.HTTP_200_OK,
+        msg='success',
+        data={
+            "job_id": job.id,
+            "status": models.JobStatus(job.status).name.lower(),
+            "attempts": job.attempts,
+            "progress": json.loads(job.progress) if job.progress else None
+        }
+    )
+
+@router.post("/collection/delete", response_model=BaseResponse)
+def delete_collection(
+    body: DeleteCollectionBody,
+    db: Session = Depends(database.get_db_session),
+    current_user: models.User = Depends(get_current_user)
+):
+    collection = crud.get_collection_by_id(id_=body.collection_id, session=db)
+    if not collection:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Collection not found."
+        )
+    if collection.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid collection id."
+        )
+    # Vectors are tombstoned first, so the content disappears from chat right away.
+    vectorstore.delete_content_from_index(
+        index_name=current_user.id,
+        content_id=collection.id
+    )
+    audio_file_path = crud.delete_collection(collection=collection, session=db)
+    if audio_file_path:
+        audio_file = os.path.join(AUDIO_DIR, os.path.basename(audio_file_path))
+        if os.path.exists(audio_file):
+            os.remove(audio_file)
+    return BaseResponse(
+        code=status.HTTP_200_OK,
+        msg='success'
+    )
+
 @router.get("/collection/list/get", response_model=BaseResponse)
 def get_collection_list(
     category_id: Optional[str]=Query(None),
     tag_id: Optional[str]=Query(None),
+    cursor: Optional[str]=Query(None),
+    limit: int=Query(COLLECTION_PAGE_SIZE, ge=1, le=COLLECTION_PAGE_MAX_SIZE),
     db: Session = Depends(database.get_db_session),
     current_user: models.User = Depends(get_current_user)
 ):
-    exclude_fields = ["category_id", "content", "user_id"]
-    if category_id:
-        items = crud.get_collections_by_category(
+    """
+    Collections of the user, newest first, one page at a time.
+    Pass the returned `next_cursor` to get the next page, it is null on the last one.
+    Items carry the listing fields only, with the category and tags by name.
+    """
+    try:
+        # One extra row tells whether there is a next page.
+        items = crud.get_collection_rows(
             user_id=current_user.id,
-            category_id=category_id,
             session=db,
-            exclude_fields=exclude_fields
-        )
-    elif tag_id:
-        items = crud.get_collections_by_tag(
-            user_id=current_user.id,
+            category_id=category_id,
             tag_id=tag_id,
-            session=db,
-            exclude_fields=exclude_fields
+            cursor=cursor,
+            limit=limit + 1
         )
-    else:
-        items = crud.get_collections(
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    next_cursor = crud.encode_cursor(items[limit - 1]) if len(items) > limit else None
+    # The rows are plain dicts, serialized directly without model validation.
+    return ORJSONResponse({
+        "code": status.HTTP_200_OK,
+        "msg": "success",
+        "data": {
+            "items": items[:limit],
+            "next_cursor": next_cursor
+        }
+    })
+
+@router.get("/collection/search")
+def search_collection(
+    q: str=Query(..., min_length=1, max_length=256),
+    cursor: Optional[str]=Query(None),
+    limit: int=Query(COLLECTION_PAGE_SIZE, ge=1, le=COLLECTION_PAGE_MAX_SIZE),
+    db: Session = Depends(database.get_db_session),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Full-text search over the title, description, summary and content of the
+    user's collections, best match first, paginated like `/collection/list/get`.
+    """
+    try:
+        items, next_cursor = crud.search_collections(
             user_id=current_user.id,
+            query=q,
             session=db,
-            exclude_fields=exclude_fields
+            cursor=cursor,
+            limit=limit
         )
-    return BaseResponse(
-        code=status.HTTP_200_OK,
-        msg='success',
-        data=items
-    )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except NotImplementedError as e:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=str(e)
+        )
+    return ORJSONResponse({
+        "code": status.HTTP_200_OK,
+        "msg": "success",
+        "data": {
+            "items": items,
+            "next_cursor": next_cursor
+        }
+    })
 
 @router.get("/collection/overview")
 def get_collection_overview(
     db: Session = Depends(database.get_db_session),
     current_user: models.User = Depends(get_current_user)
 ):
-    # get categories
-    db_categories = crud.get_user_categories(
+    categories = crud.get_category_overview(
         session=db,
         user_id=current_user.id
     )
-    categories = [
-        {
-            "id": category.id,
-            "name": category.name,
-            "description": category.description,
-            "collection_count": len(category.collections)
-        }
-        for category in db_categories
-    ]
-    # get tags
-    db_tags = crud.get_tags(
+    tags = crud.get_tag_overview(
         user_id=current_user.id,
         session=db
     )
-    tags = [
-        {
-            "id": tag.id,
-            "name": tag.name,
-            "collection_count": len(tag.collections)
-        }
-        for tag in db_tags
-    ]
     return BaseResponse(
         code=status.HTTP_200_OK,
         msg="success",
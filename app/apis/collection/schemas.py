@@ -1,9 +1,12 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class AddCollectionBody(BaseModel):
     url: str
 
+class ImportCollectionsBody(BaseModel):
+    urls: List[str]
+
 class DeleteCollectionBody(BaseModel):
     collection_id: str
 
@@ -1,6 +1,8 @@
 # from .schemas import PodcastCreate
 from app.db.models import Collection, Podcast, PodcastStatus
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 
 def get_podcast(id_: str, session: Session):
     podcast = Podcast.get(id_=id_, session=session)
@@ -8,6 +10,12 @@ def get_podcast(id_: str, session: Session):
         return podcast
     raise ValueError("Podcast not found.")
 
+async def aget_podcast(id_: str, session: AsyncSession):
+    podcast = await Podcast.aget(id_=id_, session=session)
+    if podcast:
+        return podcast
+    raise ValueError("Podcast not found.")
+
 def get_podcast_list(user_id: str, session: Session):
     return session.query(Podcast)\
         .filter(
@@ -15,6 +23,14 @@ def get_podcast_list(user_id: str, session: Session):
         )\
         .all()
 
+async def aget_podcast_list(user_id: str, session: AsyncSession):
+    result = await session.execute(
+        select(Podcast)
+        .filter(Podcast.user_id == user_id)
+        .options(selectinload(Podcast.collection))
+    )
+    return result.scalars().all()
+
 def create_podcast_from_collection(
     collection_id: str,
     session: Session
@@ -30,9 +46,31 @@ def create_podcast_from_collection(
     podcast.collection = collection
     return podcast.save(session)
 
+async def acreate_podcast_from_collection(
+    collection_id: str,
+    session: AsyncSession
+):
+    collection = await Collection.aget(session=session, id_=collection_id)
+    if not collection:
+        raise ValueError("Collection not found.")
+    podcast = Podcast(
+        title=collection.title,
+        status=PodcastStatus.GENERATING.value,
+        user_id=collection.user_id
+    )
+    podcast.collection = collection
+    return await podcast.asave(session)
+
 def delete_podcast(id_: str, session: Session):
     podcast = Podcast.get(id_=id_, session=session)
     if podcast:
         podcast.delete(session)
     else:
-        raise ValueError("Podcast does not exist.")
\ No newline at end of file
+        raise ValueError("Podcast does not exist.")
+
+async def adelete_podcast(id_: str, session: AsyncSession):
+    podcast = await Podcast.aget(id_=id_, session=session)
+    if podcast:
+        await podcast.adelete(session)
+    else:
+        raise ValueError("Podcast does not exist.")
@@ -5,34 +5,39 @@ from app.db import database, models
 from app.apis.schemas import BaseResponse
 from app.apis.podcast import crud as CRUD
 from app.apis.dependencies import get_current_user
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 
-def generate_podcast_audio(podcast_id: str, db_session: Session):
-    podcast = CRUD.get_podcast(id_=podcast_id, session=db_session)
-    collection = podcast.collection
-    audio_file = TTS.text_to_speech(
-        text=collection.content,
-        output_dir='app/public/audio',
-        identifier=podcast.id
-    )
-    if audio_file:
-        podcast.file_path = f"/audio/{audio_file}"
-        podcast.status = models.PodcastStatus.COMPLETE.value
-    else:
-        podcast.status = models.PodcastStatus.ERROR.value
-    podcast.save(db_session)
+def generate_podcast_audio(podcast_id: str):
+    # Runs after the response is sent, so it opens its own session.
+    db_session = database.SessionLocal()
+    try:
+        podcast = CRUD.get_podcast(id_=podcast_id, session=db_session)
+        collection = podcast.collection
+        audio_file = TTS.text_to_speech(
+            text=collection.content,
+            output_dir='app/public/audio',
+            identifier=podcast.id
+        )
+        if audio_file:
+            podcast.file_path = f"/audio/{audio_file}"
+            podcast.status = models.PodcastStatus.COMPLETE.value
+        else:
+            podcast.status = models.PodcastStatus.ERROR.value
+        podcast.save(db_session)
+    finally:
+        db_session.close()
 
 @router.post("/podcast/create", response_model=BaseResponse)
 async def create_podcast(
     body: PodcastCreateRequestBody,
     background_tasks: BackgroundTasks,
-    db_session: Session = Depends(database.get_db_session),
+    db_session: AsyncSession = Depends(database.get_async_db_session),
     current_user: models.User = Depends(get_current_user)
 ):
     collection_id = body.collection_id
-    collection = models.Collection.get(
+    collection = await models.Collection.aget(
         id_=collection_id,
         session=db_session
     )
@@ -47,7 +52,7 @@ async def create_podcast(
             detail="Invalid collection id."
         )
     if not collection.podcast:
-        podcast = CRUD.create_podcast_from_collection(
+        podcast = await CRUD.acreate_podcast_from_collection(
             collection_id=collection_id,
             session=db_session
         )
@@ -56,7 +61,7 @@ async def create_podcast(
         if podcast_status == models.PodcastStatus.ERROR.value:
             podcast = collection.podcast
             podcast.status = models.PodcastStatus.GENERATING.value
-            podcast.save(db_session)
+            await podcast.asave(db_session)
         elif podcast_status == models.PodcastStatus.GENERATING.value:
             return BaseResponse(
                 code=HttpStatus.HTTP_200_OK,
@@ -67,7 +72,7 @@ async def create_podcast(
                 status_code=HttpStatus.HTTP_409_CONFLICT,
                 detail="Podcast already created."
             )
-    background_tasks.add_task(generate_podcast_audio, podcast.id, db_session)
+    background_tasks.add_task(generate_podcast_audio, podcast.id)
     return BaseResponse(
         code=HttpStatus.HTTP_200_OK,
         msg="success"
@@ -75,10 +80,10 @@ async def create_podcast(
     
 @router.get("/podcast/list/get", response_model=BaseResponse)
 async def get_podcast_list(
-    db_session: Session = Depends(database.get_db_session),
+    db_session: AsyncSession = Depends(database.get_async_db_session),
     current_user: models.User = Depends(get_current_user)
 ):
-    db_podcasts = CRUD.get_podcast_list(
+    db_podcasts = await CRUD.aget_podcast_list(
         user_id=current_user.id,
         session=db_session
     )
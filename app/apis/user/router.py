@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.apis.schemas import BaseResponse
 from app.db import models, database
 from app.apis.user.schemas import UserInfo
@@ -7,8 +7,8 @@ from app.apis.user.schemas import UserInfo
 router = APIRouter()
 
 @router.post("/user/signup", response_model=BaseResponse)
-async def signup(db_session: Session = Depends(database.get_db_session)):
-    new_user = models.User().save(session=db_session)
+async def signup(db_session: AsyncSession = Depends(database.get_async_db_session)):
+    new_user = await models.User().asave(session=db_session)
     return BaseResponse(
         code=200,
         msg="success",
@@ -0,0 +1,81 @@
+"""
+Denormalized `collection_count` of categories and tags.
+
+Counts are adjusted in the same transaction as the change they reflect,
+see `app/apis/collection/crud.py`. This module can also recompute them:
+
+    python -m app.db.counters backfill
+    python -m app.db.counters check [--repair]
+"""
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from typing import Dict, List, Type, Union
+from app.db import models
+import argparse, logging
+
+logger = logging.getLogger(__name__)
+
+def count_update(model: Type[Union[models.Category, models.Tag]], ids: List[str], delta: int):
+    """Statement adding `delta` to the count of each of the given rows."""
+    return update(model) \
+        .filter(model.id.in_(ids)) \
+        .values(collection_count=model.collection_count + delta)
+
+def _actual_counts():
+    category_count = select(func.count(models.Collection.id)) \
+        .filter(models.Collection.category_id == models.Category.id) \
+        .scalar_subquery()
+    tag_count = select(func.count()) \
+        .select_from(models.collections_tags) \
+        .filter(models.collections_tags.c.tag_id == models.Tag.id) \
+        .scalar_subquery()
+    return {models.Category: category_count, models.Tag: tag_count}
+
+def backfill(session: Session) -> None:
+    """Recompute every count from the collections and tag links."""
+    for model, actual in _actual_counts().items():
+        session.execute(update(model).values(collection_count=actual))
+    session.commit()
+
+def check(session: Session, repair: bool = False) -> Dict[str, int]:
+    """
+    Find rows whose count differs from the actual number of collections,
+    and fix them if `repair` is set. Returns the number of drifted rows per table.
+    """
+    drift = {}
+    for model, actual in _actual_counts().items():
+        drifted_ids = session.execute(
+            select(model.id).filter(model.collection_count != actual)
+        ).scalars().all()
+        drift[model.__tablename__] = len(drifted_ids)
+        if drifted_ids:
+            logger.warning(f"{len(drifted_ids)} {model.__tablename__} have a wrong collection_count.")
+        if drifted_ids and repair:
+            session.execute(
+                update(model).filter(model.id.in_(drifted_ids)).values(collection_count=actual)
+            )
+    session.commit()
+    return drift
+
+if __name__ == "__main__":
+    from app.db.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s    %(levelname)s    %(message)s")
+    parser = argparse.ArgumentParser(description="Maintain the collection counts of categories and tags.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("backfill", help="recompute all counts")
+    check_parser = subparsers.add_parser("check", help="report counts that drifted")
+    check_parser.add_argument("--repair", action="store_true", help="also fix them")
+    args = parser.parse_args()
+    session = SessionLocal()
+    try:
+        if args.command == "backfill":
+            backfill(session)
+            logger.info("Backfill done.")
+        else:
+            drift = check(session, repair=args.repair)
+            logger.info(f"Check done. drift = {drift}, repaired = {args.repair}")
+            if any(drift.values()) and not args.repair:
+                raise SystemExit(1)
+    finally:
+        session.close()
@@ -1,19 +1,57 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
+from typing import AsyncIterator
+from app.db import fulltext
 import os
 
 load_dotenv()
 SQL_DATABASE_URL = os.environ["SQL_DATABASE_URL"]
 
+# Async drivers used for the sync URL's dialect when no async URL is configured.
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql"
+}
+
+def _to_async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+ASYNC_SQL_DATABASE_URL = os.getenv("ASYNC_SQL_DATABASE_URL", _to_async_url(SQL_DATABASE_URL))
+
 engine = create_engine(
     SQL_DATABASE_URL
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    ASYNC_SQL_DATABASE_URL
+)
+# Objects stay readable after commit, since lazy refreshes are not possible in async code.
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# SQL functions used by the full-text index triggers.
+fulltext.install(engine)
+fulltext.install(async_engine.sync_engine)
+
 def get_db_session():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db_session() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
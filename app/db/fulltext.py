@@ -0,0 +1,122 @@
+"""
+SQLite FTS5 index of the collections, used by `/collection/search`.
+
+`collections_fts` is a contentless index over the collection rowids. It holds
+the title, description, summary and content with CJK runs split into bigrams
+by `bigram_text`, and the hex encoded user id as a single token, so that the
+search of one user is a plain MATCH. Triggers on `collections` keep it in sync.
+They call `fts_text` as an SQL function, which is registered on the app's
+engines only: other SQLite clients can read the collections but not write them.
+
+Rowids of `collections` may change on VACUUM, rebuild the index afterwards:
+
+    python -m app.db.fulltext rebuild
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from typing import Optional
+from app.db import models
+from app.utils.lexical import bigram_text, build_term_query
+import argparse, logging
+
+FTS_TABLE = "collections_fts"
+# Indexed text columns and their bm25 weights, a match in the title counts the most.
+FTS_COLUMNS = {"title": 10.0, "description": 4.0, "summary": 2.0, "content": 1.0}
+
+logger = logging.getLogger(__name__)
+
+def _fts_text(text: Optional[str]) -> Optional[str]:
+    return bigram_text(text) if text is not None else None
+
+def register_functions(dbapi_connection, connection_record=None) -> None:
+    """Register the SQL functions the triggers call, as a "connect" event listener."""
+    dbapi_connection.create_function("fts_text", 1, _fts_text, deterministic=True)
+
+def install(engine: Engine) -> None:
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", register_functions)
+
+def match_query(user_id: str, query: str) -> Optional[str]:
+    """MATCH expression for the collections of the user matching the query, None if it has no terms."""
+    terms = build_term_query(query)
+    if not terms:
+        return None
+    # Same as SQLite's hex() of the text.
+    owner = user_id.encode("utf-8").hex().upper()
+    return f'owner : "{owner}" AND {{{" ".join(FTS_COLUMNS)}}} : ({terms})'
+
+def bm25() -> str:
+    """Ranking expression of the index, the owner column does not count."""
+    weights = ", ".join(str(weight) for weight in [0.0, *FTS_COLUMNS.values()])
+    return f"bm25({FTS_TABLE}, {weights})"
+
+def _values(row: str) -> str:
+    return ", ".join([f"hex({row}.user_id)", *(f"fts_text({row}.{column})" for column in FTS_COLUMNS)])
+
+def _ddl() -> list:
+    columns = ", ".join(["owner", *FTS_COLUMNS])
+    insert = f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (new.rowid, {_values('new')});"
+    # Contentless tables need the indexed values to delete a row.
+    delete = f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.rowid, {_values('old')});"
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            {columns},
+            content = '',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """,
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON collections BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON collections BEGIN {delete} END",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF user_id, {", ".join(FTS_COLUMNS)} ON collections
+        BEGIN {delete} {insert} END
+        """
+    ]
+
+def _index_all(connection: Connection) -> None:
+    connection.exec_driver_sql(
+        f"INSERT INTO {FTS_TABLE} (rowid, owner, {', '.join(FTS_COLUMNS)}) "
+        f"SELECT rowid, {_values('collections')} FROM collections"
+    )
+
+def create(connection: Connection) -> None:
+    """Create the index and its triggers if missing, indexing the existing collections."""
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).first()
+    for statement in _ddl():
+        connection.exec_driver_sql(statement)
+    if not exists:
+        _index_all(connection)
+        logger.info(f"Created the {FTS_TABLE} index.")
+
+def rebuild(connection: Connection) -> None:
+    """Index all collections again."""
+    connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('delete-all')")
+    _index_all(connection)
+
+def drop(connection: Connection) -> None:
+    if connection.dialect.name != "sqlite":
+        return
+    for trigger in ["ai", "ad", "au"]:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}")
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+@event.listens_for(models.Base.metadata, "after_create")
+def _create_after_tables(target, connection: Connection, **kw) -> None:
+    create(connection)
+
+if __name__ == "__main__":
+    from app.db.database import engine
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s    %(levelname)s    %(message)s")
+    parser = argparse.ArgumentParser(description="Maintain the full-text index of the collections.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="index all collections again")
+    args = parser.parse_args()
+    with engine.begin() as connection:
+        rebuild(connection)
+    logger.info("Rebuild done.")
@@ -1,6 +1,7 @@
 import uuid, enum
-from sqlalchemy import String, Text, ForeignKey, Table, Column, Integer, DateTime, func
+from sqlalchemy import String, Text, ForeignKey, Table, Column, Integer, DateTime, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, Session, relationship
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, Type, TypeVar
 from datetime import datetime, timezone
 
@@ -42,6 +43,20 @@ class Base(DeclarativeBase):
         session.delete(self)
         session.commit()
 
+    @classmethod
+    async def aget(cls: Type[T], session: AsyncSession, id_: str) -> Optional[T]:
+        return await session.get(cls, id_)
+
+    async def asave(self: T, session: AsyncSession) -> T:
+        session.add(self)
+        await session.commit()
+        await session.refresh(self)
+        return self
+
+    async def adelete(self: T, session: AsyncSession) -> None:
+        await session.delete(self)
+        await session.commit()
+
 class User(Base):
     __tablename__ = "users"
 
@@ -49,6 +64,12 @@ class User(Base):
 
 class Collection(Base):
     __tablename__ = "collections"
+    __table_args__ = (
+        # (created_at, id) is the keyset of the paginated listing.
+        Index("ix_collections_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_collections_user_id_category_id", "user_id", "category_id"),
+        Index("ix_collections_user_id_url", "user_id", "url"),
+    )
 
     url: Mapped[str] = mapped_column(String(255), unique=False, nullable=False)
     title: Mapped[str] = mapped_column(String(255), nullable=True, default=None)
@@ -76,20 +97,30 @@ class Collection(Base):
 
 class Tag(Base):
     __tablename__ = "tags"
+    __table_args__ = (
+        Index("uq_tags_user_id_name", "user_id", "name", unique=True),
+    )
 
     name: Mapped[str] = mapped_column(String(16), unique=False, nullable=False)
     collections: Mapped[list["Collection"]] = relationship(
         secondary="collections_tags",
         back_populates="tags"
     )
+    # Denormalized, see app/db/counters.py.
+    collection_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
     user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
 class Category(Base):
     __tablename__ = "categories"
+    __table_args__ = (
+        Index("uq_categories_user_id_name", "user_id", "name", unique=True),
+    )
 
     name: Mapped[str] = mapped_column(String(64), unique=False, nullable=False)
     description: Mapped[str] = mapped_column(String(255), nullable=True, default=None)
     collections: Mapped[list["Collection"]] = relationship(back_populates="category")
+    # Denormalized, see app/db/counters.py.
+    collection_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
     user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
 class PodcastStatus(enum.Enum):
@@ -113,7 +144,56 @@ class Podcast(Base):
     )
     user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
+class Article(Base):
+    """
+    Content fetched from a url and its user independent enrichment,
+    shared by every collection of the same url.
+    """
+    __tablename__ = "articles"
+
+    url: Mapped[str] = mapped_column(String(512), unique=True, nullable=False)
+    title: Mapped[str] = mapped_column(String(255), nullable=True, default=None)
+    description: Mapped[str] = mapped_column(Text, nullable=True, default=None)
+    thumbnail_url: Mapped[str] = mapped_column(String(512), nullable=True, default=None)
+    content: Mapped[str] = mapped_column(Text, nullable=True, default=None)
+    summary: Mapped[str] = mapped_column(Text, nullable=True, default=None)
+    # JSON list of keywords, used as the tags of new collections.
+    keywords: Mapped[str] = mapped_column(Text, nullable=True, default=None)
+
+class JobStatus(enum.Enum):
+    PENDING = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = -1
+
+class Job(Base):
+    """A unit of background work, persisted so that it survives restarts."""
+    __tablename__ = "jobs"
+
+    type: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    # Idempotency key, enqueuing a job with an existing key is a no-op.
+    key: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
+    payload: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    status: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        default=JobStatus.PENDING.value,
+        index=True
+    )
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=3)
+    run_after: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False
+    )
+    locked_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True, default=None)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True, default=None)
+    # JSON progress report of long running jobs.
+    progress: Mapped[str] = mapped_column(Text, nullable=True, default=None)
+
 collections_tags = Table("collections_tags", Base.metadata,
     Column("collection_id", String(255), ForeignKey("collections.id"), primary_key=True),
-    Column("tag_id", String(255), ForeignKey("tags.id"), primary_key=True)
+    Column("tag_id", String(255), ForeignKey("tags.id"), primary_key=True),
+    Index("ix_collections_tags_tag_id", "tag_id")
 )
\ No newline at end of file
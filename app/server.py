@@ -1,20 +1,59 @@
 from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from .apis.chat.router import router as chat_router
 from .apis.collection.router import router as collection_router
 from .apis.podcast.router import router as podcast_router
 from .apis.user.router import router as user_router
 from .apis.assistant.router import router as assistant_router
+from .apis.collection.processors import browser_pool, http_client, fetch_path_counts
 from .db import models, database
-import logging, os
+from .utils.compression import compression_stats
+from .utils.embeddings import get_embedding_cache
+from .utils.jobs import worker_pool
+from .utils.llm_cache import LLM_CACHE_ENABLED, get_llm_cache
+from .utils.vectorstore import embedding_batcher_stats
+import asyncio, json, logging, os
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s    %(levelname)s    %(message)s")
 logger = logging.getLogger(__file__)
 
-app = FastAPI()
+# Seconds between two log lines of the cache, batching, compression and fetch counters, 0 disables them.
+STATS_LOG_INTERVAL = float(os.getenv("STATS_LOG_INTERVAL", 600))
+
+def collect_stats(loop: asyncio.AbstractEventLoop) -> dict:
+    stats = {
+        "compression": compression_stats.stats(),
+        "fetch_paths": dict(fetch_path_counts),
+        "embedding_cache": get_embedding_cache().stats(),
+        "embedding_batcher": embedding_batcher_stats(loop)
+    }
+    if LLM_CACHE_ENABLED:
+        stats["llm_cache"] = get_llm_cache().stats()
+    return stats
+
+async def log_stats():
+    while True:
+        await asyncio.sleep(STATS_LOG_INTERVAL)
+        stats = await asyncio.to_thread(collect_stats, asyncio.get_running_loop())
+        logger.info(f"Stats: {json.dumps(stats, ensure_ascii=False)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await browser_pool.start()
+    await worker_pool.start()
+    stats_task = asyncio.create_task(log_stats()) if STATS_LOG_INTERVAL > 0 else None
+    yield
+    if stats_task:
+        stats_task.cancel()
+    await worker_pool.stop()
+    await browser_pool.stop()
+    await http_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # create audio dir
 audio_dir = "app/public/audio"
@@ -0,0 +1,138 @@
+import math, os, re, time, logging, threading
+import tiktoken
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List
+from app.utils.lexical import extract_terms
+
+# Tokens of content sent to tagging, classification and combined enrichment, 0 disables compression.
+CONTENT_TOKEN_BUDGET = int(os.getenv("CONTENT_TOKEN_BUDGET", 1500))
+# Paragraphs at the start of the article that are kept first.
+LEAD_PARAGRAPHS = int(os.getenv("LEAD_PARAGRAPHS", 2))
+# Short lines without closing punctuation are taken as headings.
+HEADING_MAX_CHARS = 40
+
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;])|(?<=\.)\s+")
+_CLOSING_PUNCTUATION = tuple("。！？!?；;.,，：:")
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _Unit:
+    position: int
+    text: str
+    tokens: int
+    score: float
+
+class CompressionStats:
+    """Token and latency counters per tool, to track the savings of compression."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tools: Dict[str, Counter] = {}
+
+    def record(self, tool: str, tokens_in: int, tokens_out: int, compress_ms: float, call_ms: float) -> None:
+        with self._lock:
+            counter = self._tools.setdefault(tool, Counter())
+            counter["calls"] += 1
+            counter["tokens_in"] += tokens_in
+            counter["tokens_out"] += tokens_out
+            counter["compress_ms"] += compress_ms
+            counter["call_ms"] += call_ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                tool: {
+                    **counter,
+                    "token_ratio": counter["tokens_out"] / counter["tokens_in"] if counter["tokens_in"] else 1.0,
+                    "avg_call_ms": counter["call_ms"] / counter["calls"]
+                }
+                for tool, counter in self._tools.items()
+            }
+
+compression_stats = CompressionStats()
+
+# Encodings by model name, looked up once per model.
+_encodings: Dict[str, tiktoken.Encoding] = {}
+
+def _get_encoding(model_name: str) -> tiktoken.Encoding:
+    encoding = _encodings.get(model_name)
+    if encoding is None:
+        encoding = _encodings[model_name] = tiktoken.encoding_for_model(model_name)
+    return encoding
+
+def count_tokens(text: str, model_name: str) -> int:
+    return len(_get_encoding(model_name).encode(text))
+
+def _truncate(text: str, model_name: str, budget: int) -> str:
+    encoding = _get_encoding(model_name)
+    return encoding.decode(encoding.encode(text)[:budget])
+
+def _split_sentences(paragraph: str) -> List[str]:
+    return [sentence for sentence in _SENTENCE_END.split(paragraph) if sentence and sentence.strip()]
+
+def _is_heading(paragraph: str) -> bool:
+    return len(paragraph) <= HEADING_MAX_CHARS and not paragraph.endswith(_CLOSING_PUNCTUATION)
+
+def compress_content(text: str, model_name: str, budget: int = CONTENT_TOKEN_BUDGET) -> str:
+    """
+    Cut the text down to about `budget` tokens for tasks that only need its gist.
+    Lead paragraphs and headings are kept first, then the sentences sharing the
+    most frequent terms of the text. The kept parts stay in their original order.
+    The result is never empty for a non-empty text, at worst it is a prefix of it.
+    """
+    if budget <= 0 or count_tokens(text, model_name) <= budget:
+        return text
+    paragraphs = [line.strip() for line in text.splitlines() if line.strip()]
+    frequencies = Counter(extract_terms(text.lower()))
+    units: List[_Unit] = []
+    for index, paragraph in enumerate(paragraphs):
+        if index < LEAD_PARAGRAPHS or _is_heading(paragraph):
+            tokens = count_tokens(paragraph, model_name)
+            if tokens <= budget:
+                units.append(_Unit(len(units), paragraph, tokens, math.inf))
+                continue
+            # A lead paragraph over the budget, e.g. a whole article extracted as one
+            # paragraph, has its sentences kept first in order instead.
+            for sentence in _split_sentences(paragraph):
+                units.append(_Unit(len(units), sentence.strip(), count_tokens(sentence, model_name), math.inf))
+            continue
+        for sentence in _split_sentences(paragraph):
+            terms = set(extract_terms(sentence.lower()))
+            score = sum(math.log1p(frequencies[term]) for term in terms) / math.sqrt(len(terms)) if terms else 0.0
+            units.append(_Unit(len(units), sentence.strip(), count_tokens(sentence, model_name), score))
+    kept: List[_Unit] = []
+    kept_texts = set()
+    used = 0
+    for unit in sorted(units, key=lambda unit: (-unit.score, unit.position)):
+        # Boilerplate repeated across the article is kept once.
+        if used + unit.tokens > budget or unit.text in kept_texts:
+            continue
+        kept.append(unit)
+        kept_texts.add(unit.text)
+        used += unit.tokens
+    if not kept:
+        # No sentence fits the budget on its own.
+        return _truncate(text, model_name, budget)
+    return "\n".join(unit.text for unit in sorted(kept, key=lambda unit: unit.position))
+
+def measure(tool: str, model_name: str, text: str, call, budget: int = CONTENT_TOKEN_BUDGET):
+    """
+    Compress the text, pass it to `call` and record tokens and latency.
+    With a budget of 0 the original text is passed, giving the baseline figures.
+    """
+    start = time.perf_counter()
+    compressed = compress_content(text, model_name, budget)
+    compress_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    result = call(compressed)
+    call_ms = (time.perf_counter() - start) * 1000
+    tokens_in = count_tokens(text, model_name)
+    tokens_out = tokens_in if compressed is text else count_tokens(compressed, model_name)
+    compression_stats.record(tool, tokens_in, tokens_out, compress_ms, call_ms)
+    logger.info(
+        f"{tool}: tokens {tokens_in} -> {tokens_out}, "
+        f"compress {compress_ms:.0f} ms, call {call_ms:.0f} ms"
+    )
+    return result
@@ -0,0 +1,190 @@
+import json, sqlite3, threading
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Union
+from collections.abc import Mapping
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+def _chunks_table(generation: int) -> str:
+    return "chunks" if generation == 0 else f"chunks_{generation}"
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Chunk text and metadata of a FAISS index, stored in SQLite and keyed by FAISS id.
+    Only the rows of the search hits are read, so the corpus does not have to be
+    held in memory.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS docstore_meta (generation INTEGER NOT NULL)")
+        if self._conn.execute("SELECT COUNT(*) FROM docstore_meta").fetchone()[0] == 0:
+            self._conn.execute("INSERT INTO docstore_meta (generation) VALUES (0)")
+        # The rows of the generation current when the docstore is opened are read
+        # until it is closed, so an index loaded together with it keeps matching
+        # its rows after a `compact` through another connection.
+        self.generation = self._conn.execute("SELECT generation FROM docstore_meta").fetchone()[0]
+        self._table = _chunks_table(self.generation)
+        self._create_table(self._table)
+        if self.generation == 0:
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE chunks ADD COLUMN owner TEXT")
+            self._create_indexes(self._table)
+        self._conn.commit()
+
+    def _create_table(self, table: str) -> None:
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                faiss_id INTEGER PRIMARY KEY,
+                owner TEXT,
+                content_id TEXT,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+            """
+        )
+
+    def _create_indexes(self, table: str) -> None:
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_content_id ON {table} (content_id)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_owner ON {table} (owner)")
+
+    def search(self, search: Union[int, str]) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT page_content, metadata FROM {self._table} WHERE faiss_id = ?",
+                (int(search),)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[Union[int, str], Document], owner: Optional[str] = None) -> None:
+        """
+        Insert documents keyed by their FAISS id. `owner` is set when several
+        users share one index, see `ids_for_owner`.
+        """
+        with self._lock:
+            # Rows left behind by an interrupted write are overwritten.
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self._table} (faiss_id, owner, content_id, page_content, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        int(faiss_id),
+                        owner,
+                        doc.metadata.get("content_id"),
+                        doc.page_content,
+                        json.dumps(doc.metadata, ensure_ascii=False)
+                    )
+                    for faiss_id, doc in texts.items()
+                ]
+            )
+            self._conn.commit()
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self._conn.executemany(
+                f"DELETE FROM {self._table} WHERE faiss_id = ?",
+                [(int(id_),) for id_ in ids]
+            )
+            self._conn.commit()
+
+    def ids_for_owner(self, owner: str) -> np.ndarray:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT faiss_id FROM {self._table} WHERE owner = ?",
+                (owner,)
+            ).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def ids_for_content(self, content_id: str, owner: Optional[str] = None) -> List[int]:
+        query = f"SELECT faiss_id FROM {self._table} WHERE content_id = ?"
+        params = [content_id]
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [row[0] for row in rows]
+
+    def compact(self, kept_ids: np.ndarray) -> None:
+        """
+        Keep only the rows of `kept_ids`, renumbered to 0..len(kept_ids) - 1 to match
+        an index rebuilt from the kept vectors. The renumbered rows are written as a
+        new generation, so docstores opened before keep reading the old one. Older
+        generations are dropped.
+        """
+        new_table = _chunks_table(self.generation + 1)
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE kept (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO kept (old_id, new_id) VALUES (?, ?)",
+                    [(int(old_id), new_id) for new_id, old_id in enumerate(kept_ids)]
+                )
+                self._conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+                self._create_table(new_table)
+                self._conn.execute(
+                    f"""
+                    INSERT INTO {new_table} (faiss_id, owner, content_id, page_content, metadata)
+                    SELECT kept.new_id, chunks.owner, chunks.content_id, chunks.page_content, chunks.metadata
+                    FROM {self._table} AS chunks JOIN kept ON kept.old_id = chunks.faiss_id
+                    """
+                )
+                self._create_indexes(new_table)
+                self._conn.execute("UPDATE docstore_meta SET generation = ?", (self.generation + 1,))
+                if self.generation > 0:
+                    # Readers of the previous generation were invalidated by the last compaction.
+                    self._conn.execute(f"DROP TABLE IF EXISTS {_chunks_table(self.generation - 1)}")
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            finally:
+                self._conn.execute("DROP TABLE kept")
+            self.generation += 1
+            self._table = new_table
+
+    def close(self) -> None:
+        self._conn.close()
+
+def docstore_generation(path: str) -> int:
+    """
+    Current generation of the docstore at `path`, bumped by every `compact`.
+    0 for a docstore that was never compacted.
+    """
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return 0
+    try:
+        row = conn.execute("SELECT generation FROM docstore_meta").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+    return row[0] if row else 0
+
+class FaissIdMapping(Mapping):
+    """
+    Stand-in for `FAISS.index_to_docstore_id` when the docstore is keyed by FAISS id,
+    so no per-vector dictionary has to be kept in memory.
+    """
+
+    def __init__(self, index) -> None:
+        self.index = index
+
+    def __getitem__(self, key: int) -> int:
+        if not 0 <= key < self.index.ntotal:
+            raise KeyError(key)
+        return int(key)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.index.ntotal))
+
+    def __len__(self) -> int:
+        return self.index.ntotal
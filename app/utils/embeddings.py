@@ -0,0 +1,253 @@
+import os, sqlite3, hashlib, threading, time, logging, asyncio
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    f'{os.curdir}/app/db/files/embedding_cache.db'
+)
+# Maximum number of cached vectors, least recently used ones are evicted first.
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 500_000))
+# Concurrent embedding requests are coalesced until either limit is reached.
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", 256))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", 20))
+
+logger = logging.getLogger(__name__)
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed store of embedding vectors keyed by
+    (model, sha256(text)). Vectors are stored as float32 blobs.
+    """
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+        # Counted once, then kept up to date by `put_many` and `_evict`.
+        (self._entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        if not hashes:
+            return {}
+        unique_hashes = list(set(hashes))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # Stay well below SQLite's limit of bound parameters per statement.
+            for start in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found]
+                )
+                self._conn.commit()
+            hit_count = sum(1 for h in hashes if h in found)
+            self.hits += hit_count
+            self.misses += len(hashes) - hit_count
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            # Vectors are content-addressed, a row stored meanwhile holds the same vector.
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [
+                    (model, text_hash, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for text_hash, vector in items.items()
+                ]
+            )
+            self._entries += cursor.rowcount
+            if self._entries > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": self._entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def _evict(self) -> None:
+        """Evict down to 1% below `max_entries`, so the next puts don't evict again."""
+        overflow = self._entries - self.max_entries + max(1, self.max_entries // 100)
+        cursor = self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (overflow,)
+        )
+        self._entries -= cursor.rowcount
+        logger.info(f"Evicted {cursor.rowcount} entries from the embedding cache.")
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings client so that only texts missing from the cache are sent to the model.
+    Queries are not cached, one-off query vectors would only push chunk vectors out.
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model: str) -> None:
+        self.underlying = underlying
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [_text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model, hashes)
+        missing: Dict[str, str] = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in vectors:
+                missing[text_hash] = text
+        if missing:
+            new_vectors = self.underlying.embed_documents(list(missing.values()))
+            # Round to float32 like the cached copies, so results do not depend on cache state.
+            computed = {
+                text_hash: np.asarray(vector, dtype=np.float32).tolist()
+                for text_hash, vector in zip(missing.keys(), new_vectors)
+            }
+            self.cache.put_many(self.model, computed)
+            vectors.update(computed)
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return np.asarray(self.underlying.embed_query(text), dtype=np.float32).tolist()
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                path=EMBEDDING_CACHE_PATH,
+                max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+            )
+        return _cache
+
+@dataclass
+class _PendingRequest:
+    texts: List[str]
+    future: asyncio.Future
+    enqueued_at: float
+
+class EmbeddingBatcher:
+    """
+    Coalesces texts from concurrent callers into a single embeddings call.
+    A batch is sent once `max_batch_size` texts are queued or the oldest
+    request has waited `max_wait_ms`, and the vectors are fanned back out
+    to each caller. Must be used from a single event loop.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int, max_wait_ms: float) -> None:
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._pending: List[_PendingRequest] = []
+        self._pending_count = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # metrics
+        self.batch_count = 0
+        self.request_count = 0
+        self.text_count = 0
+        self.largest_batch = 0
+        self.total_wait_ms = 0.0
+        self.longest_wait_ms = 0.0
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        request = _PendingRequest(texts=texts, future=loop.create_future(), enqueued_at=time.monotonic())
+        self._pending.append(request)
+        self._pending_count += len(texts)
+        if self._pending_count >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        return await request.future
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batch_count,
+            "requests": self.request_count,
+            "texts": self.text_count,
+            "avg_batch_size": self.text_count / self.batch_count if self.batch_count else 0.0,
+            "max_batch_size": self.largest_batch,
+            "avg_wait_ms": self.total_wait_ms / self.request_count if self.request_count else 0.0,
+            "max_wait_ms": self.longest_wait_ms
+        }
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        requests, self._pending, self._pending_count = self._pending, [], 0
+        if requests:
+            task = asyncio.ensure_future(self._run_batch(requests))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, requests: List[_PendingRequest]) -> None:
+        now = time.monotonic()
+        texts = [text for request in requests for text in request.texts]
+        for request in requests:
+            wait_ms = (now - request.enqueued_at) * 1000
+            self.total_wait_ms += wait_ms
+            self.longest_wait_ms = max(self.longest_wait_ms, wait_ms)
+        self.batch_count += 1
+        self.request_count += len(requests)
+        self.text_count += len(texts)
+        self.largest_batch = max(self.largest_batch, len(texts))
+        logger.info(f"Embedding batch: {len(texts)} texts from {len(requests)} requests.")
+        try:
+            vectors = await self.embeddings.aembed_documents(texts)
+        except Exception as e:
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        offset = 0
+        for request in requests:
+            if not request.future.done():
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+            offset += len(request.texts)
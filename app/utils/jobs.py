@@ -0,0 +1,293 @@
+import asyncio, inspect, json, logging, os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import AsyncSessionLocal, SessionLocal
+from app.db.models import Job, JobStatus
+
+# Seconds between polls of the job table when a worker is idle.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1))
+# Base delay of the exponential retry backoff, in seconds.
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", 5))
+# Jobs whose lock was not refreshed for this long are assumed to belong to a crashed worker.
+JOB_LOCK_TIMEOUT = float(os.getenv("JOB_LOCK_TIMEOUT", 600))
+# Seconds between lock refreshes of a running job.
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", JOB_LOCK_TIMEOUT / 4))
+# Seconds between checks for such jobs.
+JOB_REQUEUE_INTERVAL = float(os.getenv("JOB_REQUEUE_INTERVAL", 60))
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class JobHandler:
+    func: Callable[..., Any]
+    concurrency: int
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+async def aenqueue_jobs(session: AsyncSession, jobs: List[Tuple[str, str, dict]]) -> None:
+    """
+    Persist jobs given as (type, key, payload) in one transaction.
+    Jobs whose key already exists are skipped, so enqueuing is idempotent.
+    """
+    keys = [key for _, key, _ in jobs]
+    result = await session.execute(select(Job.key).filter(Job.key.in_(keys)))
+    existing = set(result.scalars().all())
+    for job_type, key, payload in jobs:
+        if key in existing:
+            continue
+        session.add(Job(type=job_type, key=key, payload=json.dumps(payload)))
+        existing.add(key)
+    try:
+        await session.commit()
+    except IntegrityError:
+        # A concurrent request enqueued the same key first.
+        await session.rollback()
+        for job_type, key, payload in jobs:
+            if (await session.execute(select(Job.id).filter(Job.key == key))).first():
+                continue
+            session.add(Job(type=job_type, key=key, payload=json.dumps(payload)))
+            try:
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+    worker_pool.notify()
+
+def _claim_job(job_type: str) -> Optional[Tuple[str, dict, int]]:
+    session = SessionLocal()
+    try:
+        now = _utcnow()
+        job = session.query(Job) \
+            .filter(
+                Job.type == job_type,
+                Job.status == JobStatus.PENDING.value,
+                Job.run_after <= now
+            ) \
+            .order_by(Job.run_after) \
+            .first()
+        if not job:
+            return None
+        job_id, payload, attempt = job.id, json.loads(job.payload), job.attempts + 1
+        # Only one worker wins the status transition, even across processes.
+        claimed = session.query(Job) \
+            .filter(Job.id == job.id, Job.status == JobStatus.PENDING.value) \
+            .update(
+                {
+                    Job.status: JobStatus.RUNNING.value,
+                    Job.attempts: Job.attempts + 1,
+                    Job.locked_at: now
+                },
+                synchronize_session=False
+            )
+        session.commit()
+        if not claimed:
+            return None
+        return job_id, payload, attempt
+    finally:
+        session.close()
+
+def _finish_job(job_id: str, attempt: int, error: Optional[str] = None) -> None:
+    session = SessionLocal()
+    try:
+        job = Job.get(session=session, id_=job_id)
+        if not job:
+            return
+        job.locked_at = None
+        if error is None:
+            job.status = JobStatus.DONE.value
+            job.last_error = None
+        elif attempt < job.max_attempts:
+            job.status = JobStatus.PENDING.value
+            job.run_after = _utcnow() + timedelta(seconds=JOB_RETRY_BACKOFF * 2 ** (attempt - 1))
+            job.last_error = error
+        else:
+            job.status = JobStatus.FAILED.value
+            job.last_error = error
+        session.commit()
+    finally:
+        session.close()
+
+async def update_job_progress(session: AsyncSession, job_id: str, progress: dict) -> None:
+    """
+    Stage a progress update of the job in the given session, so it is
+    committed together with the work it describes. It also refreshes the
+    job's lock.
+    """
+    await session.execute(
+        update(Job).filter(Job.id == job_id).values(progress=json.dumps(progress), locked_at=_utcnow())
+    )
+
+def _refresh_lock(job_id: str) -> None:
+    session = SessionLocal()
+    try:
+        session.query(Job) \
+            .filter(Job.id == job_id, Job.status == JobStatus.RUNNING.value) \
+            .update({Job.locked_at: _utcnow()}, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+def _release_job(job_id: str) -> None:
+    """Put a job interrupted by shutdown back in the queue, without using up an attempt."""
+    session = SessionLocal()
+    try:
+        session.query(Job) \
+            .filter(Job.id == job_id, Job.status == JobStatus.RUNNING.value) \
+            .update(
+                {
+                    Job.status: JobStatus.PENDING.value,
+                    Job.attempts: Job.attempts - 1,
+                    Job.locked_at: None
+                },
+                synchronize_session=False
+            )
+        session.commit()
+    finally:
+        session.close()
+
+def requeue_stale_jobs() -> int:
+    """
+    Put jobs left running by a crashed worker back in the queue. The crashed run
+    used up the attempt counted when the job was claimed, so jobs out of
+    attempts, e.g. ones that keep killing their worker, fail instead.
+    """
+    session = SessionLocal()
+    try:
+        stale = [
+            Job.status == JobStatus.RUNNING.value,
+            Job.locked_at < _utcnow() - timedelta(seconds=JOB_LOCK_TIMEOUT)
+        ]
+        failed = session.query(Job) \
+            .filter(*stale, Job.attempts >= Job.max_attempts) \
+            .update(
+                {Job.status: JobStatus.FAILED.value, Job.locked_at: None, Job.last_error: "Worker lost."},
+                synchronize_session=False
+            )
+        if failed:
+            logger.error(f"Failed {failed} stale jobs out of attempts.")
+        count = session.query(Job) \
+            .filter(*stale) \
+            .update(
+                {Job.status: JobStatus.PENDING.value, Job.locked_at: None},
+                synchronize_session=False
+            )
+        session.commit()
+        return count
+    finally:
+        session.close()
+
+class WorkerPool:
+    """
+    Runs registered job handlers on the event loop with a fixed number of
+    workers per job type. Each job gets its own DB session, an `AsyncSession`
+    for async handlers, which is passed to the handler together with the job
+    payload as keyword arguments. Handlers taking a `job_id` argument also
+    receive the job id, e.g. to report progress with `update_job_progress`.
+    """
+
+    def __init__(self) -> None:
+        self.handlers: Dict[str, JobHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(self, job_type: str, func: Callable[..., Any], concurrency: int = 1) -> None:
+        self.handlers[job_type] = JobHandler(func=func, concurrency=concurrency)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks.append(asyncio.create_task(self._requeue_stale()))
+        for job_type, handler in self.handlers.items():
+            for _ in range(handler.concurrency):
+                self._tasks.append(asyncio.create_task(self._work(job_type, handler)))
+        logger.info(f"Worker pool started with {len(self._tasks) - 1} workers.")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Wake idle workers up, callable from any thread."""
+        if self._loop is None or self._wakeup is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _work(self, job_type: str, handler: JobHandler) -> None:
+        while True:
+            try:
+                claimed = await asyncio.to_thread(_claim_job, job_type)
+            except Exception as e:
+                logger.error(f"Claim job failed, type = {job_type}, error: {e}")
+                claimed = None
+            if claimed is None:
+                await self._wait_for_work()
+                continue
+            job_id, payload, attempt = claimed
+            error = await self._run(handler, job_id, payload)
+            if error:
+                logger.error(f"Job failed, type = {job_type}, id = {job_id}, attempt = {attempt}, error: {error}")
+            await asyncio.to_thread(_finish_job, job_id, attempt, error)
+
+    async def _requeue_stale(self) -> None:
+        """Requeue the jobs of crashed workers, at startup and then periodically."""
+        while True:
+            try:
+                requeued = await asyncio.to_thread(requeue_stale_jobs)
+                if requeued:
+                    logger.info(f"Requeued {requeued} stale jobs.")
+                    self.notify()
+            except Exception as e:
+                logger.error(f"Requeue stale jobs failed, error: {e}")
+            await asyncio.sleep(JOB_REQUEUE_INTERVAL)
+
+    async def _wait_for_work(self) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _run(self, handler: JobHandler, job_id: str, payload: dict) -> Optional[str]:
+        kwargs = dict(payload)
+        if "job_id" in inspect.signature(handler.func).parameters:
+            kwargs["job_id"] = job_id
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            if inspect.iscoroutinefunction(handler.func):
+                async with AsyncSessionLocal() as session:
+                    await handler.func(**kwargs, session=session)
+            else:
+                session = SessionLocal()
+                try:
+                    await asyncio.to_thread(handler.func, **kwargs, session=session)
+                finally:
+                    session.close()
+            return None
+        except asyncio.CancelledError:
+            # Stopped mid-job, it runs again on the next start instead of staying RUNNING.
+            _release_job(job_id)
+            raise
+        except Exception as e:
+            return repr(e)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Refresh the lock of a running job, so it is not taken for a crashed worker's."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await asyncio.to_thread(_refresh_lock, job_id)
+            except Exception as e:
+                logger.error(f"Refresh job lock failed, id = {job_id}, error: {e}")
+
+worker_pool = WorkerPool()
@@ -0,0 +1,168 @@
+import json, re, sqlite3, threading
+from typing import List, Optional
+from langchain_core.documents import Document
+
+# CJK ideographs, kana and hangul are indexed one character per token,
+# since the default FTS5 tokenizer would treat a whole run of them as one word.
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK_CHAR = re.compile(f"([{_CJK}])")
+_CJK_RUN = re.compile(f"[{_CJK}]+")
+_QUERY_TERM = re.compile(f"[{_CJK}]+|[^\\W{_CJK}_]+")
+# Match markers of `make_snippet`, control characters that do not occur in text.
+SNIPPET_OPEN = "\x02"
+SNIPPET_CLOSE = "\x03"
+
+def segment_text(text: str) -> str:
+    """Put spaces around CJK characters so each of them becomes an FTS5 token."""
+    return _CJK_CHAR.sub(r" \1 ", text)
+
+def bigram_text(text: str) -> str:
+    """
+    Replace CJK runs with their overlapping bigrams, so that an FTS5 index
+    of the text can be queried with the terms of `extract_terms` directly.
+    """
+    def bigrams(run: re.Match) -> str:
+        chars = run.group(0)
+        return " " + (chars if len(chars) == 1 else " ".join(chars[i:i + 2] for i in range(len(chars) - 1))) + " "
+    return _CJK_RUN.sub(bigrams, text)
+
+def extract_terms(text: str) -> List[str]:
+    """Latin words and overlapping bigrams of CJK runs, in order of appearance."""
+    terms = []
+    for term in _QUERY_TERM.findall(text):
+        if _CJK_CHAR.match(term):
+            terms.extend([term] if len(term) == 1 else [term[i:i + 2] for i in range(len(term) - 1)])
+        else:
+            terms.append(term)
+    return terms
+
+def build_match_query(query: str) -> str:
+    """
+    Turn free text into an FTS5 MATCH expression. Latin words are matched as
+    terms and CJK runs as overlapping bigram phrases, OR-ed together so that
+    bm25 ranks chunks sharing more of them higher.
+    """
+    phrases = [
+        " ".join(term) if _CJK_CHAR.match(term) else term
+        for term in extract_terms(query)
+    ]
+    unique_phrases = list(dict.fromkeys(phrases))
+    return " OR ".join('"' + phrase.replace('"', '""') + '"' for phrase in unique_phrases)
+
+def build_term_query(query: str) -> str:
+    """
+    `build_match_query` for text indexed with `bigram_text`. Every term is a
+    token of the index, a single CJK character matches the bigrams it starts.
+    """
+    terms = list(dict.fromkeys(extract_terms(query)))
+    return " OR ".join(
+        '"' + term.replace('"', '""') + '"' + ("*" if _CJK_CHAR.fullmatch(term) else "")
+        for term in terms
+    )
+
+def _term_pattern(terms: List[str]) -> re.Pattern:
+    alternatives = [
+        re.escape(term) if _CJK_CHAR.match(term) else f"(?<![^\\W{_CJK}_]){re.escape(term)}(?![^\\W{_CJK}_])"
+        for term in sorted(terms, key=len, reverse=True)
+    ]
+    return re.compile("|".join(alternatives), re.IGNORECASE)
+
+def make_snippet(texts: List[Optional[str]], query: str, size: int) -> str:
+    """
+    About `size` characters of the text matching the most terms of the query,
+    taken where the matches are densest. Matches are put between SNIPPET_OPEN
+    and SNIPPET_CLOSE, adjacent ones merged, and cuts are marked with "…".
+    """
+    texts = [text for text in texts if text]
+    terms = list(dict.fromkeys(extract_terms(query.lower())))
+    if not texts:
+        return ""
+    if not terms:
+        return texts[0][:size] + ("…" if len(texts[0]) > size else "")
+    pattern = _term_pattern(terms)
+    matches = [list(pattern.finditer(text)) for text in texts]
+    best = max(
+        range(len(texts)),
+        key=lambda i: (len({match.group(0).lower() for match in matches[i]}), -i)
+    )
+    text, spans = texts[best], [match.span() for match in matches[best]]
+    start = 0
+    if spans:
+        # The match starting the window of `size` characters with the most matches.
+        densest = max(
+            range(len(spans)),
+            key=lambda i: (sum(1 for span in spans[i:] if span[1] <= spans[i][0] + size), -i)
+        )
+        start = max(0, min(spans[densest][0] - size // 4, len(text) - size))
+    end = min(len(text), start + size)
+    merged: List[List[int]] = []
+    for span_start, span_end in spans:
+        if span_end <= start or span_start >= end:
+            continue
+        span_start, span_end = max(span_start, start), min(span_end, end)
+        if merged and span_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], span_end)
+        else:
+            merged.append([span_start, span_end])
+    parts, position = [], start
+    for span_start, span_end in merged:
+        parts += [text[position:span_start], SNIPPET_OPEN, text[span_start:span_end], SNIPPET_CLOSE]
+        position = span_end
+    parts.append(text[position:end])
+    return ("…" if start > 0 else "") + "".join(parts).strip() + ("…" if end < len(text) else "")
+
+class LexicalIndex:
+    """SQLite FTS5 inverted index over the chunks of one vector store index."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                tokens,
+                page_content UNINDEXED,
+                content_id UNINDEXED,
+                metadata UNINDEXED,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+            """
+        )
+        self._conn.commit()
+
+    def add(self, chunks: List[Document]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO chunks_fts (tokens, page_content, content_id, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        segment_text(chunk.page_content),
+                        chunk.page_content,
+                        chunk.metadata.get("content_id"),
+                        json.dumps(chunk.metadata, ensure_ascii=False)
+                    )
+                    for chunk in chunks
+                ]
+            )
+            self._conn.commit()
+
+    def search(self, query: str, k: int = 20) -> List[Document]:
+        match = build_match_query(query)
+        if not match:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page_content, metadata FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY rank LIMIT ?",
+                (match, k)
+            ).fetchall()
+        return [Document(page_content=row[0], metadata=json.loads(row[1])) for row in rows]
+
+    def delete_content(self, content_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks_fts WHERE content_id = ?", (content_id,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,151 @@
+import os, sqlite3, hashlib, json, threading, time, logging
+from typing import Any, Dict, Optional
+from langchain_community.callbacks import get_openai_callback
+from langchain_core.runnables import Runnable
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    f'{os.curdir}/app/db/files/llm_cache.db'
+)
+# Results older than this are recomputed, in seconds.
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600))
+# Maximum number of cached results, least recently used ones are evicted first.
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 100_000))
+
+logger = logging.getLogger(__name__)
+
+def cache_key(tool: str, model: str, prompt_version: int, inputs: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        [tool, model, prompt_version, inputs],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMResultCache:
+    """
+    Persistent store of tool results keyed by (tool, model, prompt version, inputs).
+    Results are JSON encoded, together with the tokens the call used, so that
+    the tokens saved by cache hits can be reported.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_results (
+                key TEXT PRIMARY KEY,
+                tool TEXT NOT NULL,
+                result TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_llm_results_last_used ON llm_results (last_used)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, tokens, created_at FROM llm_results WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is not None and now - row[2] > self.ttl:
+                self._conn.execute("DELETE FROM llm_results WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_results SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            self.saved_tokens += row[1]
+        return json.loads(row[0])
+
+    def put(self, key: str, tool: str, result: Any, tokens: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_results (key, tool, result, tokens, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool, json.dumps(result, ensure_ascii=False), tokens, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_tokens": self.saved_tokens
+        }
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM llm_results WHERE created_at < ?", (now - self.ttl,))
+        (entries,) = self._conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()
+        overflow = entries - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM llm_results WHERE key IN "
+                "(SELECT key FROM llm_results ORDER BY last_used LIMIT ?)",
+                (overflow,)
+            )
+            logger.info(f"Evicted {overflow} entries from the LLM result cache.")
+
+_cache: Optional[LLMResultCache] = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMResultCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResultCache(
+                path=LLM_CACHE_PATH,
+                ttl=LLM_CACHE_TTL,
+                max_entries=LLM_CACHE_MAX_ENTRIES
+            )
+        return _cache
+
+def cached_invoke(
+    chain: Runnable,
+    inputs: Dict[str, Any],
+    tool: str,
+    model: str,
+    prompt_version: int
+) -> Any:
+    """
+    Invoke the chain, or return its cached result for the same tool, model,
+    prompt version and inputs. Results must be JSON serializable.
+    """
+    if not LLM_CACHE_ENABLED:
+        return chain.invoke(inputs)
+    cache = get_llm_cache()
+    key = cache_key(tool=tool, model=model, prompt_version=prompt_version, inputs=inputs)
+    result = cache.get(key)
+    if result is not None:
+        logger.info(f"LLM cache hit. tool = {tool}")
+        return result
+    with get_openai_callback() as callback:
+        result = chain.invoke(inputs)
+    cache.put(key=key, tool=tool, result=result, tokens=callback.total_tokens)
+    return result
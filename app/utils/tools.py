@@ -2,10 +2,32 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.utils.function_calling import convert_to_openai_function
 from langchain.output_parsers.openai_functions import JsonOutputFunctionsParser
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from pydantic import BaseModel, Field
+import os
+from app.utils.llm_cache import cached_invoke
+from app.utils import compression
 import app.utils.llm as LLM
 
+# Bump a tool's version whenever its prompt or output schema changes,
+# so results cached for the previous prompt are not reused.
+PROMPT_VERSIONS = {
+    "summary_tool": 1,
+    "summary_map": 1,
+    "summary_reduce": 1,
+    "rewrite_tool": 1,
+    "tagging_tool": 1,
+    "classification_tool": 1,
+    "enrichment_tool": 1
+}
+
+# Longer texts are summarized chunk by chunk, then the partial summaries are merged.
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 6000))
+# Concurrent model calls per map-reduce summary.
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", 4))
+
 class TaggingToolOutput(BaseModel):
     tags: List[str] = Field(description="Provide less than 5 keywords related to the content.")
 
@@ -13,16 +35,103 @@ class ClassificationToolOutput(BaseModel):
     name: str = Field(description="The name of the category.")
     description: str = Field(description="The description of the category")
 
+class EnrichmentToolOutput(BaseModel):
+    summary: str = Field(description="A concise summary of the content, in the same language as the content.")
+    tags: List[str] = Field(description="Provide less than 5 keywords related to the content.")
+    category_name: str = Field(description="The name of the category, with no more than 3 words.")
+    category_description: str = Field(description="The description of the category.")
+
 def summary_tool(text: str):
-    """Returns the summary of the given text."""
+    """
+    Returns the summary of the given text.
+    Texts longer than `SUMMARY_CHUNK_TOKENS` are summarized with `map_reduce_summary`.
+    """
     llm = LLM.get_simple_model(long_context=len(text) > 8192)
+    chunks = _split_for_summary(text, llm.model_name)
+    if len(chunks) > 1:
+        return map_reduce_summary(chunks, llm)
     prompt = ChatPromptTemplate.from_messages([
         ("system", "Summarize the following text concisely, focusing on the main points and key information.\
                     Remember, the language of the returned content should be the same as the original input."),
         ("user", "{input}")
     ])
     chain = prompt | llm | StrOutputParser()
-    return chain.invoke({"input": text})
+    return cached_invoke(
+        chain,
+        {"input": text},
+        tool="summary_tool",
+        model=llm.model_name,
+        prompt_version=PROMPT_VERSIONS["summary_tool"]
+    )
+
+def _split_for_summary(text: str, model_name: str) -> List[str]:
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name=model_name,
+        chunk_size=SUMMARY_CHUNK_TOKENS,
+        chunk_overlap=0,
+        separators=["\n\n", "\n", "。", ". ", " ", ""]
+    )
+    return text_splitter.split_text(text)
+
+def _group_by_tokens(texts: List[str], llm) -> List[List[str]]:
+    """Pack consecutive texts into groups of at most `SUMMARY_CHUNK_TOKENS` tokens, at least two per group."""
+    groups = [[]]
+    group_tokens = 0
+    for text in texts:
+        tokens = llm.get_num_tokens(text)
+        if len(groups[-1]) >= 2 and group_tokens + tokens > SUMMARY_CHUNK_TOKENS:
+            groups.append([])
+            group_tokens = 0
+        groups[-1].append(text)
+        group_tokens += tokens
+    return groups
+
+def map_reduce_summary(chunks: List[str], llm) -> str:
+    """
+    Summarize the chunks concurrently, then merge the partial summaries in
+    concurrent rounds until one is left. The elapsed time grows with the
+    number of rounds rather than the number of chunks.
+    """
+    map_prompt = ChatPromptTemplate.from_messages([
+        ("system", "The following text is one part of a longer article. Summarize it concisely, \
+                    focusing on the main points and key information.\
+                    Remember, the language of the returned content should be the same as the original input."),
+        ("user", "{input}")
+    ])
+    reduce_prompt = ChatPromptTemplate.from_messages([
+        ("system", "The following are summaries of consecutive parts of one article. \
+                    Combine them into a single concise summary of the whole article, \
+                    focusing on the main points and key information.\
+                    Remember, the language of the returned content should be the same as the original input."),
+        ("user", "{input}")
+    ])
+    map_chain = map_prompt | llm | StrOutputParser()
+    reduce_chain = reduce_prompt | llm | StrOutputParser()
+
+    def summarize_chunk(chunk: str) -> str:
+        return cached_invoke(
+            map_chain,
+            {"input": chunk},
+            tool="summary_map",
+            model=llm.model_name,
+            prompt_version=PROMPT_VERSIONS["summary_map"]
+        )
+
+    def merge_summaries(summaries: List[str]) -> str:
+        return cached_invoke(
+            reduce_chain,
+            {"input": "\n\n".join(summaries)},
+            tool="summary_reduce",
+            model=llm.model_name,
+            prompt_version=PROMPT_VERSIONS["summary_reduce"]
+        )
+
+    with ThreadPoolExecutor(max_workers=SUMMARY_MAX_CONCURRENCY) as executor:
+        summaries = list(executor.map(summarize_chunk, chunks))
+        while True:
+            summaries = list(executor.map(merge_summaries, _group_by_tokens(summaries, llm)))
+            if len(summaries) == 1:
+                return summaries[0]
 
 def rewrite_tool(text: str, instruction: str):
     """Rewrites the given text according to the instruction"""
@@ -34,7 +143,13 @@ def rewrite_tool(text: str, instruction: str):
         ("user", "Text: {text}")
     ])
     chain = prompt | llm | StrOutputParser()
-    return chain.invoke({"text": text, "instruction": instruction})
+    return cached_invoke(
+        chain,
+        {"text": text, "instruction": instruction},
+        tool="rewrite_tool",
+        model=llm.model_name,
+        prompt_version=PROMPT_VERSIONS["rewrite_tool"]
+    )
 
 
 def tagging_tool(text: str):
@@ -42,7 +157,8 @@ def tagging_tool(text: str):
     functions = [
         convert_to_openai_function(TaggingToolOutput)
     ]
-    llm = LLM.get_tool_calling_model().bind(
+    model = LLM.get_tool_calling_model()
+    llm = model.bind(
         functions=functions,
         function_call={"name": "TaggingToolOutput"}
     )
@@ -52,14 +168,27 @@ def tagging_tool(text: str):
         ("user", "{input}")
     ])
     chain = prompt | llm | JsonOutputFunctionsParser()
-    return chain.invoke({"input": text})
+    # A few keywords only need the gist of the text.
+    return compression.measure(
+        "tagging_tool",
+        model.model_name,
+        text,
+        lambda content: cached_invoke(
+            chain,
+            {"input": content},
+            tool="tagging_tool",
+            model=model.model_name,
+            prompt_version=PROMPT_VERSIONS["tagging_tool"]
+        )
+    )
 
 def classification_tool(text: str, category_names: List[str] = []):
     """Classify the given text into the most relevant category based on its content."""
     functions = [
         convert_to_openai_function(ClassificationToolOutput)
     ]
-    llm = LLM.get_tool_calling_model().bind(
+    model = LLM.get_tool_calling_model()
+    llm = model.bind(
         functions=functions,
         function_call={"name": "ClassificationToolOutput"}
     )
@@ -71,4 +200,67 @@ def classification_tool(text: str, category_names: List[str] = []):
         ("user", "categories: {categories}")
     ])
     chain = prompt | llm | JsonOutputFunctionsParser()
-    return chain.invoke({"input": text, "categories": category_names})
+    return compression.measure(
+        "classification_tool",
+        model.model_name,
+        text,
+        lambda content: cached_invoke(
+            chain,
+            {"input": content, "categories": category_names},
+            tool="classification_tool",
+            model=model.model_name,
+            prompt_version=PROMPT_VERSIONS["classification_tool"]
+        )
+    )
+
+def enrichment_tool(text: str, category_names: List[str] = []):
+    """
+    Summarize, tag and classify the given text in a single call,
+    so the content is only sent to the model once.
+    Texts longer than `SUMMARY_CHUNK_TOKENS` are first summarized with
+    `map_reduce_summary`, the call then tags and classifies that summary.
+    Like the tagging and classification tools, the call gets the text
+    compressed to `CONTENT_TOKEN_BUDGET` tokens.
+    """
+    summary = None
+    summary_llm = LLM.get_simple_model(long_context=len(text) > 8192)
+    chunks = _split_for_summary(text, summary_llm.model_name)
+    if len(chunks) > 1:
+        summary = map_reduce_summary(chunks, summary_llm)
+        text = summary
+    functions = [
+        convert_to_openai_function(EnrichmentToolOutput)
+    ]
+    model = LLM.get_tool_calling_model()
+    llm = model.bind(
+        functions=functions,
+        function_call={"name": "EnrichmentToolOutput"}
+    )
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Analyze the following text and return: \
+            1. A concise summary focusing on the main points and key information, \
+            in the same language as the original text. \
+            2. Keywords representing the main content and core themes of the text. \
+            3. The most relevant of the provided categories. \
+            If the text does not fit any existing category, create a new category. \
+            The category name you returned should be consice and tidy, with no more than 3 words."),
+        ("user", "content: {input}"),
+        ("user", "categories: {categories}")
+    ])
+    chain = prompt | llm | JsonOutputFunctionsParser()
+    response = compression.measure(
+        "enrichment_tool",
+        model.model_name,
+        text,
+        lambda content: cached_invoke(
+            chain,
+            {"input": content, "categories": category_names},
+            tool="enrichment_tool",
+            model=model.model_name,
+            prompt_version=PROMPT_VERSIONS["enrichment_tool"]
+        )
+    )
+    if summary is not None:
+        # The map-reduce summary covers the whole text.
+        response["summary"] = summary
+    return response
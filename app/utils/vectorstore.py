@@ -1,23 +1,347 @@
-import os
-from langchain_community.vectorstores.faiss import FAISS
+import os, threading, uuid, logging, asyncio, weakref, enum, json, time, math, hashlib, sqlite3
+import numpy as np
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.faiss import FAISS, dependable_faiss_import
 from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.vectorstores import VectorStore
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
+from app.utils.docstore import SQLiteDocstore, FaissIdMapping, docstore_generation
+from app.utils.lexical import LexicalIndex
+from app.utils.embeddings import (
+    CachedEmbeddings,
+    EmbeddingBatcher,
+    get_embedding_cache,
+    EMBEDDING_BATCH_MAX_SIZE,
+    EMBEDDING_BATCH_MAX_WAIT_MS
+)
 
 VECTOR_STORE_DIR = f'{os.curdir}/app/db/files/vector_store'
+# Output dimension of the default OpenAI embedding model (text-embedding-ada-002).
+EMBEDDING_DIMENSION = 1536
+# Upper bound of the memory held by loaded vector stores in this process.
+VECTOR_STORE_CACHE_MAX_BYTES = int(os.getenv("VECTOR_STORE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+class VectorStoreMode(str, enum.Enum):
+    # FAISS index and pickled InMemoryDocstore, both fully loaded into memory.
+    PICKLE = "pickle"
+    # FAISS index memory-mapped read-only, chunks kept in a SQLite docstore.
+    SQLITE = "sqlite"
+    # All users share a few append-only shard files of raw vectors, chunks kept in
+    # a SQLite docstore per shard. A user's searches run on an exact index of the
+    # user's own vectors.
+    SHARDED = "sharded"
+
+VECTOR_STORE_MODE = VectorStoreMode(os.getenv("VECTOR_STORE_MODE", VectorStoreMode.PICKLE.value))
+VECTOR_STORE_SHARD_COUNT = int(os.getenv("VECTOR_STORE_SHARD_COUNT", 16))
+
+class PromotedIndexType(str, enum.Enum):
+    HNSW = "hnsw"
+    IVF_PQ = "ivfpq"
+
+# Flat (exact) indexes are rebuilt as an approximate index once they hold this many vectors.
+VECTOR_INDEX_PROMOTION_THRESHOLD = int(os.getenv("VECTOR_INDEX_PROMOTION_THRESHOLD", 50_000))
+VECTOR_INDEX_PROMOTED_TYPE = PromotedIndexType(
+    os.getenv("VECTOR_INDEX_PROMOTED_TYPE", PromotedIndexType.HNSW.value)
+)
+# Promotions whose recall@10 against exact search is lower are discarded.
+VECTOR_INDEX_MIN_RECALL = float(os.getenv("VECTOR_INDEX_MIN_RECALL", 0.9))
+# Indexes are compacted once this fraction of their vectors is tombstoned.
+VECTOR_INDEX_COMPACTION_RATIO = float(os.getenv("VECTOR_INDEX_COMPACTION_RATIO", 0.2))
+
+logger = logging.getLogger(__name__)
+
+_index_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_index_locks_guard = threading.Lock()
+_swap_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_rebuilds_in_progress = set()
+_rebuilds_guard = threading.Lock()
+_embedding_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, EmbeddingBatcher]" = weakref.WeakKeyDictionary()
 
 def _get_embeddings():
-    return OpenAIEmbeddings()
+    embeddings = OpenAIEmbeddings()
+    return CachedEmbeddings(
+        underlying=embeddings,
+        cache=get_embedding_cache(),
+        model=embeddings.model
+    )
 
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """Returns the embedding batcher bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    batcher = _embedding_batchers.get(loop)
+    if batcher is None:
+        batcher = EmbeddingBatcher(
+            embeddings=_get_embeddings(),
+            max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+            max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS
+        )
+        _embedding_batchers[loop] = batcher
+    return batcher
 
-def load_vector_store_by_index(index_name: str) -> VectorStore:
-    index_file_path = f"{VECTOR_STORE_DIR}/{index_name}.faiss"
-    if os.path.exists(index_file_path) == False:
-        FAISS.from_texts(
-            texts=["text"],
-            embedding=_get_embeddings()
-        ).save_local(folder_path=VECTOR_STORE_DIR, index_name=index_name)
+def embedding_batcher_stats(loop: asyncio.AbstractEventLoop) -> Optional[dict]:
+    """Stats of the embedding batcher of `loop`, None before its first use."""
+    batcher = _embedding_batchers.get(loop)
+    return batcher.stats() if batcher else None
+
+def _get_index_lock(index_name: str) -> threading.Lock:
+    """Writers of the same index are serialized so concurrent appends are not lost."""
+    with _index_locks_guard:
+        return _index_locks[index_name]
+
+def _get_swap_lock(storage_name: str) -> threading.Lock:
+    """
+    Held while an index and its docstore are loaded together, and while compaction
+    replaces both, so a load never pairs an index with the other's numbering.
+    """
+    with _index_locks_guard:
+        return _swap_locks[storage_name]
+
+def _index_file_path(index_name: str, ext: str = "faiss") -> str:
+    return f"{VECTOR_STORE_DIR}/{index_name}.{ext}"
+
+def _shard_name(index_name: str) -> str:
+    shard = int(hashlib.sha1(index_name.encode("utf-8")).hexdigest(), 16) % VECTOR_STORE_SHARD_COUNT
+    return f"shard-{shard}"
+
+def _storage_name(index_name: str) -> str:
+    """Name of the files that hold the vectors of `index_name`."""
+    if VECTOR_STORE_MODE == VectorStoreMode.SHARDED:
+        return _shard_name(index_name)
+    return index_name
+
+def _create_empty_vector_store(dimension: int = EMBEDDING_DIMENSION) -> FAISS:
+    faiss = dependable_faiss_import()
+    return FAISS(
+        embedding_function=_get_embeddings(),
+        index=faiss.IndexFlatL2(dimension),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+
+def _storage_path(storage_name: str) -> str:
+    if VECTOR_STORE_MODE == VectorStoreMode.SHARDED:
+        return _shard_vectors_path(storage_name)
+    return _index_file_path(storage_name)
+
+def _index_mtime(index_name: str) -> Optional[int]:
+    """Version of the files the user's store is loaded from."""
+    storage_name = _storage_name(index_name)
+    if not os.path.exists(_storage_path(storage_name)):
+        return None
+    if VECTOR_STORE_MODE == VectorStoreMode.SHARDED:
+        # Appends of other users change the shard file but not this user's vectors,
+        # only compaction renumbers them, bumping the docstore generation. Appends
+        # of the user bump the cache version.
+        return docstore_generation(_docstore_path(storage_name))
+    try:
+        return os.stat(_storage_path(storage_name)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _docstore_path(index_name: str) -> str:
+    return _index_file_path(index_name, "docstore.db")
+
+def _lexical_index_path(index_name: str) -> str:
+    return _index_file_path(index_name, "lexical.db")
+
+def _tombstone_db() -> sqlite3.Connection:
+    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+    conn = sqlite3.connect(f"{VECTOR_STORE_DIR}/tombstones.db")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tombstones (
+            index_name TEXT NOT NULL,
+            faiss_id INTEGER NOT NULL,
+            content_id TEXT,
+            PRIMARY KEY (index_name, faiss_id)
+        )
+        """
+    )
+    return conn
+
+def _tombstoned_ids(index_name: str) -> np.ndarray:
+    """FAISS ids of deleted vectors that are still physically in the index."""
+    conn = _tombstone_db()
+    try:
+        rows = conn.execute(
+            "SELECT faiss_id FROM tombstones WHERE index_name = ?",
+            (index_name,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return np.array([row[0] for row in rows], dtype=np.int64)
+
+def _add_tombstones(index_name: str, content_id: str, faiss_ids: List[int]):
+    conn = _tombstone_db()
+    try:
+        conn.executemany(
+            "INSERT OR IGNORE INTO tombstones (index_name, faiss_id, content_id) VALUES (?, ?, ?)",
+            [(index_name, int(faiss_id), content_id) for faiss_id in faiss_ids]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def _clear_tombstones(index_name: str):
+    conn = _tombstone_db()
+    try:
+        conn.execute("DELETE FROM tombstones WHERE index_name = ?", (index_name,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def _estimate_size(index_name: str, vector_store: FAISS) -> int:
+    if VECTOR_STORE_MODE == VectorStoreMode.SHARDED:
+        # A view holds a copy of the user's vectors and their ids.
+        return vector_store.index.ntotal * (vector_store.index.d * 4 + 8)
+    return sum(
+        os.path.getsize(_index_file_path(index_name, ext))
+        for ext in ("faiss", "pkl")
+        if os.path.exists(_index_file_path(index_name, ext))
+    )
+
+def _search_parameters(index, selector):
+    faiss = dependable_faiss_import()
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+class FilteredIndex:
+    """
+    View of a faiss index whose searches skip the ids rejected by `selector`.
+    Used to hide tombstoned vectors.
+    """
+
+    def __init__(self, index, selector, ntotal: int, *selector_refs) -> None:
+        self.index = index
+        self.d = index.d
+        self.ntotal = ntotal
+        # Selectors must outlive the search parameters referencing them.
+        self._selector_refs = (selector, *selector_refs)
+        self._params = _search_parameters(index, selector)
+
+    def search(self, x: np.ndarray, k: int):
+        if not self.ntotal:
+            return (
+                np.full((len(x), k), np.inf, dtype=np.float32),
+                np.full((len(x), k), -1, dtype=np.int64)
+            )
+        return self.index.search(x, k, params=self._params)
+
+def _filter_tombstoned_ids(index, tombstoned_ids: np.ndarray):
+    if not len(tombstoned_ids):
+        return index
+    faiss = dependable_faiss_import()
+    tombstones = faiss.IDSelectorBatch(tombstoned_ids)
+    return FilteredIndex(
+        index,
+        faiss.IDSelectorNot(tombstones),
+        index.ntotal - len(tombstoned_ids),
+        tombstones
+    )
+
+@dataclass
+class _CacheEntry:
+    vector_store: FAISS
+    mtime: Optional[int]
+    version: int
+    size: int
+
+class VectorStoreCache:
+    """
+    Process-wide LRU of loaded vector stores keyed by index name (the user id).
+    Entries are evicted once the estimated memory of all entries exceeds `max_bytes`,
+    and are reloaded when the index file changes on disk or its version is bumped.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._versions: Dict[str, int] = defaultdict(int)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, index_name: str, loader: Callable[[str], FAISS]) -> FAISS:
+        mtime = _index_mtime(index_name)
+        with self._lock:
+            version = self._versions[index_name]
+            entry = self._entries.get(index_name)
+            if entry and entry.mtime == mtime and entry.version == version:
+                self._entries.move_to_end(index_name)
+                self.hits += 1
+                return entry.vector_store
+            self.misses += 1
+        # Loading happens outside the lock so other users are not blocked on disk I/O.
+        vector_store = loader(index_name)
+        self._store(index_name, vector_store, mtime, version)
+        return vector_store
+
+    def put(self, index_name: str, vector_store: FAISS) -> None:
+        """Replace the cached store after a write, invalidating older copies."""
+        with self._lock:
+            self._versions[index_name] += 1
+            version = self._versions[index_name]
+        self._store(index_name, vector_store, _index_mtime(index_name), version)
+
+    def invalidate(self, index_name: str) -> None:
+        with self._lock:
+            self._versions[index_name] += 1
+            self._remove(index_name)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _store(self, index_name: str, vector_store: FAISS, mtime: Optional[int], version: int) -> None:
+        size = _estimate_size(index_name, vector_store)
+        with self._lock:
+            if version != self._versions[index_name]:
+                # A newer write landed while this copy was loading.
+                return
+            self._remove(index_name)
+            if size > self.max_bytes:
+                return
+            self._entries[index_name] = _CacheEntry(vector_store, mtime, version, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                evicted_name, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                logger.info(f"Evict vector store from cache. index_name = {evicted_name}")
+
+    def _remove(self, index_name: str) -> None:
+        entry = self._entries.pop(index_name, None)
+        if entry:
+            self._size -= entry.size
+
+vector_store_cache = VectorStoreCache(max_bytes=VECTOR_STORE_CACHE_MAX_BYTES)
+
+def _read_vector_store(index_name: str) -> FAISS:
+    """Loads the store used for searches, with tombstoned vectors filtered out."""
+    if VECTOR_STORE_MODE == VectorStoreMode.SHARDED:
+        return _read_shard_view(index_name)
+    if VECTOR_STORE_MODE == VectorStoreMode.SQLITE:
+        with _get_swap_lock(index_name):
+            vector_store = _read_mmap_vector_store(index_name)
+            tombstoned_ids = _tombstoned_ids(index_name)
+    else:
+        with _get_swap_lock(index_name):
+            vector_store = _read_pickle_vector_store(index_name)
+            tombstoned_ids = _tombstoned_ids(index_name)
+    vector_store.index = _filter_tombstoned_ids(vector_store.index, tombstoned_ids)
+    return vector_store
+
+def _read_pickle_vector_store(index_name: str) -> FAISS:
     return FAISS.load_local(
         folder_path=VECTOR_STORE_DIR,
         index_name=index_name,
@@ -25,19 +349,528 @@ def load_vector_store_by_index(index_name: str) -> VectorStore:
         allow_dangerous_deserialization=True
     )
 
-def save_content_to_index(
-    index_name: str,
-    content: str,
-    metadata: dict,
-):
+def _read_mmap_index(index_name: str):
+    faiss = dependable_faiss_import()
+    # IO_FLAG_MMAP_IFC also maps flat indexes; older faiss builds only have IO_FLAG_MMAP.
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(_index_file_path(index_name), mmap_flag | faiss.IO_FLAG_READ_ONLY)
+
+def _read_mmap_vector_store(index_name: str) -> FAISS:
+    """Callers hold the swap lock of the index, so the index and docstore match."""
+    index = _read_mmap_index(index_name)
+    docstore = SQLiteDocstore(_docstore_path(index_name))
+    return FAISS(
+        embedding_function=_get_embeddings(),
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=FaissIdMapping(index)
+    )
+
+# Shard files start with the vector dimension, followed by the vectors as
+# float32 rows; the row number is the FAISS id.
+_SHARD_HEADER = np.dtype(np.int64).itemsize
+
+def _shard_vectors_path(shard_name: str) -> str:
+    return _index_file_path(shard_name, "vectors")
+
+def _shard_dimension(shard_name: str) -> int:
+    with open(_shard_vectors_path(shard_name), "rb") as f:
+        return int(np.frombuffer(f.read(_SHARD_HEADER), dtype=np.int64)[0])
+
+def _shard_vector_count(shard_name: str) -> int:
+    """Rows of the shard, a partial row left by an interrupted append is not counted."""
+    d = _shard_dimension(shard_name)
+    return (os.path.getsize(_shard_vectors_path(shard_name)) - _SHARD_HEADER) // (d * 4)
+
+def _read_shard_vectors(shard_name: str, ids: np.ndarray) -> np.ndarray:
+    d = _shard_dimension(shard_name)
+    count = _shard_vector_count(shard_name)
+    if not count:
+        return np.empty((0, d), dtype=np.float32)
+    vectors = np.memmap(_shard_vectors_path(shard_name), dtype=np.float32, mode="r", offset=_SHARD_HEADER, shape=(count, d))
+    return np.array(vectors[ids])
+
+def _write_shard_vectors(shard_name: str, vectors: np.ndarray, d: int):
+    """Write a shard file atomically."""
+    tmp_path = _index_file_path(f".{shard_name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(np.array([d], dtype=np.int64).tobytes())
+        f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+    os.replace(tmp_path, _shard_vectors_path(shard_name))
+
+def _convert_shard_index(shard_name: str):
+    """Move the vectors of a shard stored as a faiss index, as older versions did, into a shard file."""
+    if os.path.exists(_shard_vectors_path(shard_name)) or not os.path.exists(_index_file_path(shard_name)):
+        return
+    with _get_index_lock(shard_name), _get_swap_lock(shard_name):
+        if os.path.exists(_shard_vectors_path(shard_name)) or not os.path.exists(_index_file_path(shard_name)):
+            return
+        faiss = dependable_faiss_import()
+        index = faiss.read_index(_index_file_path(shard_name))
+        _write_shard_vectors(shard_name, index.reconstruct_n(0, index.ntotal), index.d)
+        os.remove(_index_file_path(shard_name))
+
+def _read_shard_view(index_name: str) -> FAISS:
+    """
+    Exact index of the user's vectors, with their shard ids. Searching the whole
+    shard through an id selector loses most results once the shard is approximate.
+    """
+    faiss = dependable_faiss_import()
+    shard_name = _shard_name(index_name)
+    with _get_swap_lock(shard_name):
+        docstore = SQLiteDocstore(_docstore_path(shard_name))
+        ids = np.setdiff1d(docstore.ids_for_owner(index_name), _tombstoned_ids(shard_name))
+        vectors = _read_shard_vectors(shard_name, ids)
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(vectors.shape[1]))
+    if len(ids):
+        index.add_with_ids(vectors, ids)
+    return FAISS(
+        embedding_function=_get_embeddings(),
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id={int(id_): int(id_) for id_ in ids}
+    )
+
+def _write_index_file(index, index_name: str):
+    """Write a raw faiss index atomically."""
+    faiss = dependable_faiss_import()
+    tmp_path = _index_file_path(f".{index_name}.{uuid.uuid4().hex}.tmp")
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, _index_file_path(index_name))
+
+def _persist_vector_store(vector_store: FAISS, index_name: str):
+    """
+    Save the index under a temporary name and rename it over the live files,
+    so readers never observe a half-written index. Callers hold the swap lock,
+    so a load never pairs the new `.pkl` with the old `.faiss`.
+    """
+    tmp_name = f".{index_name}.{uuid.uuid4().hex}.tmp"
+    vector_store.save_local(folder_path=VECTOR_STORE_DIR, index_name=tmp_name)
+    # The docstore goes first: a reader that sees the new `.faiss` file
+    # must also find the entries for the new vectors.
+    for ext in ("pkl", "faiss"):
+        os.replace(_index_file_path(tmp_name, ext), _index_file_path(index_name, ext))
+
+
+def load_vector_store_by_index(index_name: str) -> VectorStore:
+    """Returns the user's vector store; in sharded mode a view restricted to the user's vectors."""
+    storage_name = _storage_name(index_name)
+    if VECTOR_STORE_MODE == VectorStoreMode.SHARDED:
+        _convert_shard_index(storage_name)
+    if not os.path.exists(_storage_path(storage_name)):
+        return _create_empty_vector_store()
+    return vector_store_cache.get(index_name, loader=_read_vector_store)
+
+def _chunk_key(doc: Document) -> tuple:
+    return (doc.metadata.get("content_id"), doc.metadata.get("start_index"), doc.page_content[:64])
+
+class HybridRetriever(BaseRetriever):
+    """
+    Merges dense (FAISS) and lexical (FTS5) rankings with reciprocal-rank fusion,
+    so exact keywords such as names are found even when embeddings miss them.
+    """
+
+    vector_store: VectorStore
+    lexical_index_path: str
+    k: int = 4
+    fetch_k: int = 20
+    # Damping constant of reciprocal-rank fusion.
+    rrf_k: int = 60
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        rankings = [self.vector_store.similarity_search(query, k=self.fetch_k)]
+        if os.path.exists(self.lexical_index_path):
+            lexical_index = LexicalIndex(self.lexical_index_path)
+            try:
+                rankings.append(lexical_index.search(query, k=self.fetch_k))
+            finally:
+                lexical_index.close()
+        scores: Dict[tuple, float] = defaultdict(float)
+        docs: Dict[tuple, Document] = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking):
+                key = _chunk_key(doc)
+                scores[key] += 1 / (self.rrf_k + rank + 1)
+                docs.setdefault(key, doc)
+        ranked_keys = sorted(scores, key=scores.get, reverse=True)
+        return [docs[key] for key in ranked_keys[:self.k]]
+
+def load_hybrid_retriever_by_index(index_name: str) -> HybridRetriever:
+    return HybridRetriever(
+        vector_store=load_vector_store_by_index(index_name),
+        lexical_index_path=_lexical_index_path(index_name)
+    )
+
+def split_content(content: str, metadata: dict) -> List[Document]:
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200,
         add_start_index=True
     )
     docs = [Document(page_content=content, metadata=metadata)]
-    chunks = text_splitter.split_documents(docs)
+    return text_splitter.split_documents(docs)
+
+def _append_to_sqlite_index(index_name: str, chunks: List[Document], embeddings: List[List[float]]):
+    faiss = dependable_faiss_import()
+    if os.path.exists(_index_file_path(index_name)):
+        index = faiss.read_index(_index_file_path(index_name))
+    else:
+        os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+        index = faiss.IndexFlatL2(len(embeddings[0]))
+    start = index.ntotal
+    index.add(np.array(embeddings, dtype=np.float32))
+    # Rows are written before the index, so every id a reader can get back
+    # from the index already has its chunk.
+    docstore = SQLiteDocstore(_docstore_path(index_name))
+    try:
+        docstore.add({start + i: chunk for i, chunk in enumerate(chunks)})
+    finally:
+        docstore.close()
+    _write_index_file(index, index_name)
+    return index
+
+def _append_to_shard(shard_name: str, owner: str, chunks: List[Document], embeddings: List[List[float]]):
+    """
+    Append the vectors at the end of the shard file, then their chunks. Only the
+    new rows are written, and views of other users stay valid.
+    """
+    vectors = np.array(embeddings, dtype=np.float32)
+    path = _shard_vectors_path(shard_name)
+    if not os.path.exists(path):
+        os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+        _write_shard_vectors(shard_name, np.empty((0, vectors.shape[1]), dtype=np.float32), vectors.shape[1])
+    start = _shard_vector_count(shard_name)
+    with open(path, "r+b") as f:
+        # Rows are written after the last complete one, dropping a partial row.
+        f.truncate(_SHARD_HEADER + start * vectors.shape[1] * 4)
+        f.seek(0, os.SEEK_END)
+        f.write(vectors.tobytes())
+    # Rows are only found through their chunks, so the vectors go first.
+    docstore = SQLiteDocstore(_docstore_path(shard_name))
+    try:
+        docstore.add({start + i: chunk for i, chunk in enumerate(chunks)}, owner=owner)
+    finally:
+        docstore.close()
+
+def _append_to_pickle_index(index_name: str, chunks: List[Document], embeddings: List[List[float]]):
+    if os.path.exists(_index_file_path(index_name)):
+        vector_store = _read_pickle_vector_store(index_name)
+    else:
+        vector_store = _create_empty_vector_store(dimension=len(embeddings[0]))
+    vector_store.add_embeddings(
+        text_embeddings=zip([chunk.page_content for chunk in chunks], embeddings),
+        metadatas=[chunk.metadata for chunk in chunks]
+    )
+    with _get_swap_lock(index_name):
+        _persist_vector_store(vector_store, index_name)
+    index = vector_store.index
+    vector_store.index = _filter_tombstoned_ids(index, _tombstoned_ids(index_name))
+    vector_store_cache.put(index_name, vector_store)
+    return index
+
+def _append_to_lexical_index(index_name: str, chunks: List[Document]):
+    lexical_index = LexicalIndex(_lexical_index_path(index_name))
+    try:
+        lexical_index.add(chunks)
+    finally:
+        lexical_index.close()
+
+def _append_to_index(index_name: str, chunks: List[Document], embeddings: List[List[float]]):
+    storage_name = _storage_name(index_name)
+    if VECTOR_STORE_MODE == VectorStoreMode.SHARDED:
+        _convert_shard_index(storage_name)
+    with _get_index_lock(storage_name):
+        if VECTOR_STORE_MODE == VectorStoreMode.SHARDED:
+            _append_to_shard(storage_name, index_name, chunks, embeddings)
+            vector_store_cache.invalidate(index_name)
+            _append_to_lexical_index(index_name, chunks)
+            # Shards are never promoted, user views are exact.
+            return
+        if VECTOR_STORE_MODE == VectorStoreMode.SQLITE:
+            index = _append_to_sqlite_index(index_name, chunks, embeddings)
+            vector_store_cache.invalidate(index_name)
+        else:
+            index = _append_to_pickle_index(index_name, chunks, embeddings)
+        _append_to_lexical_index(index_name, chunks)
+        _maybe_schedule_promotion(storage_name, index)
+
+def _start_rebuild(index_name: str, target: Callable[[str], object]):
+    """
+    Run a promotion or compaction of `index_name` in a background thread.
+    Both replace the index file, so at most one of them runs per index.
+    """
+    with _rebuilds_guard:
+        if index_name in _rebuilds_in_progress:
+            return
+        _rebuilds_in_progress.add(index_name)
+    def run():
+        try:
+            target(index_name)
+        finally:
+            with _rebuilds_guard:
+                _rebuilds_in_progress.discard(index_name)
+    threading.Thread(target=run, daemon=True).start()
+
+def _promotion_report(index_name: str) -> Optional[dict]:
+    try:
+        with open(_index_file_path(index_name, "promotion.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _maybe_schedule_promotion(index_name: str, index):
+    faiss = dependable_faiss_import()
+    if not isinstance(index, faiss.IndexFlat) or index.ntotal < VECTOR_INDEX_PROMOTION_THRESHOLD:
+        return
+    report = _promotion_report(index_name)
+    if report and not report.get("promoted", True) and index.ntotal < 2 * report["vectors"]:
+        # A rejected promotion is only retried once the index has doubled.
+        return
+    _start_rebuild(index_name, promote_index)
+
+def _build_approximate_index(vectors: np.ndarray, index_type: PromotedIndexType):
+    faiss = dependable_faiss_import()
+    n, d = vectors.shape
+    if index_type == PromotedIndexType.IVF_PQ:
+        nlist = max(1, int(4 * math.sqrt(n)))
+        # Sub-quantizers must divide the dimension and keep at least 8 dimensions each.
+        m = next((m for m in (64, 48, 32, 16, 8, 4, 2) if d % m == 0 and d // m >= 8), 1)
+        index = faiss.index_factory(d, f"IVF{nlist},PQ{m}x8")
+        index.train(vectors)
+        index.nprobe = min(nlist, 16)
+        index.add(vectors)
+        # Keeps `reconstruct` available for later rebuilds.
+        index.make_direct_map()
+    else:
+        index = faiss.IndexHNSWFlat(d, 32)
+        index.hnsw.efConstruction = 80
+        index.hnsw.efSearch = 64
+        index.add(vectors)
+    return index
+
+def _evaluate_index(exact_index, approximate_index, sample_size: int = 200, k: int = 10) -> dict:
+    """Compare recall@k and per-query latency of `approximate_index` against exact search."""
+    n = exact_index.ntotal
+    rng = np.random.default_rng(0)
+    sample_ids = rng.choice(n, size=min(sample_size, n), replace=False)
+    queries = np.vstack([exact_index.reconstruct(int(i)) for i in sample_ids]).astype(np.float32)
+    start = time.perf_counter()
+    _, exact_ids = exact_index.search(queries, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    start = time.perf_counter()
+    _, approximate_ids = approximate_index.search(queries, k)
+    approximate_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    hits = sum(
+        len(set(exact_row[exact_row >= 0]) & set(approximate_row[approximate_row >= 0]))
+        for exact_row, approximate_row in zip(exact_ids, approximate_ids)
+    )
+    expected = sum(int((row >= 0).sum()) for row in exact_ids)
+    return {
+        "vectors": n,
+        "queries": len(queries),
+        "k": k,
+        "recall": hits / expected if expected else 1.0,
+        "exact_latency_ms": exact_ms,
+        "approximate_latency_ms": approximate_ms
+    }
+
+def promote_index(index_name: str, index_type: PromotedIndexType = VECTOR_INDEX_PROMOTED_TYPE) -> Optional[dict]:
+    """
+    Rebuild a flat index as an approximate one and swap it in, unless its recall
+    is below VECTOR_INDEX_MIN_RECALL, in which case the flat index is kept.
+    Training runs without holding the index lock; vectors appended meanwhile
+    are copied over right before the swap. FAISS ids are preserved, so the
+    docstore needs no change. Returns the recall/latency report, which is
+    also written next to the index.
+    """
+    faiss = dependable_faiss_import()
+    try:
+        flat_index = faiss.read_index(_index_file_path(index_name))
+        if not isinstance(flat_index, faiss.IndexFlat):
+            return None
+        logger.info(f"Promoting index to {index_type.value}. index_name = {index_name}, vectors = {flat_index.ntotal}")
+        trained_count = flat_index.ntotal
+        new_index = _build_approximate_index(flat_index.reconstruct_n(0, trained_count), index_type)
+        report = _evaluate_index(flat_index, new_index)
+        report["index_type"] = index_type.value
+        report["promoted"] = report["recall"] >= VECTOR_INDEX_MIN_RECALL
+        if not report["promoted"]:
+            with open(_index_file_path(index_name, "promotion.json"), "w") as f:
+                json.dump(report, f, indent=2)
+            logger.warning(f"Promote index, recall too low, keeping the flat index. index_name = {index_name}, report = {report}")
+            return report
+        with _get_index_lock(index_name):
+            current_index = faiss.read_index(_index_file_path(index_name))
+            if current_index.ntotal > trained_count:
+                new_index.add(current_index.reconstruct_n(trained_count, current_index.ntotal - trained_count))
+            _write_index_file(new_index, index_name)
+            vector_store_cache.invalidate(index_name)
+        with open(_index_file_path(index_name, "promotion.json"), "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Promote index, Done. index_name = {index_name}, report = {report}")
+        return report
+    except Exception as e:
+        logger.error(f"Promote index failed. index_name = {index_name}, error: {e}")
+        return None
+
+def save_content_to_index(
+    index_name: str,
+    content: str,
+    metadata: dict,
+):
+    """
+    Append the chunks of `content` to the user's index, creating it on first use.
+    Only the new chunks are embedded; the existing vectors and docstore entries
+    are kept as they are.
+    """
+    chunks = split_content(content, metadata)
+    if not chunks:
+        return
+    embeddings = _get_embeddings().embed_documents([chunk.page_content for chunk in chunks])
+    _append_to_index(index_name, chunks, embeddings)
+
+async def asave_content_to_index(
+    index_name: str,
+    content: str,
+    metadata: dict,
+):
+    """
+    Async version of `save_content_to_index`. The chunks are embedded through the
+    shared batcher, so concurrent ingests are sent to the model in one call.
+    """
+    chunks = split_content(content, metadata)
+    if not chunks:
+        return
+    embeddings = await get_embedding_batcher().embed([chunk.page_content for chunk in chunks])
+    await asyncio.to_thread(_append_to_index, index_name, chunks, embeddings)
+
+def _content_faiss_ids(index_name: str, content_id: str) -> List[int]:
+    storage_name = _storage_name(index_name)
+    if VECTOR_STORE_MODE == VectorStoreMode.PICKLE:
+        vector_store = _read_pickle_vector_store(storage_name)
+        return [
+            faiss_id
+            for faiss_id, doc_id in vector_store.index_to_docstore_id.items()
+            if vector_store.docstore.search(doc_id).metadata.get("content_id") == content_id
+        ]
+    owner = index_name if VECTOR_STORE_MODE == VectorStoreMode.SHARDED else None
+    docstore = SQLiteDocstore(_docstore_path(storage_name))
+    try:
+        return docstore.ids_for_content(content_id, owner=owner)
+    finally:
+        docstore.close()
+
+def delete_content_from_index(index_name: str, content_id: str):
+    """
+    Hide the chunks of `content_id` from searches right away by tombstoning
+    their vectors. The index is compacted in the background once
+    VECTOR_INDEX_COMPACTION_RATIO of it is tombstoned.
+    """
+    storage_name = _storage_name(index_name)
+    if not os.path.exists(_storage_path(storage_name)):
+        return
+    with _get_index_lock(storage_name):
+        faiss_ids = _content_faiss_ids(index_name, content_id)
+        _add_tombstones(storage_name, content_id, faiss_ids)
+        if os.path.exists(_lexical_index_path(index_name)):
+            lexical_index = LexicalIndex(_lexical_index_path(index_name))
+            try:
+                lexical_index.delete_content(content_id)
+            finally:
+                lexical_index.close()
+        vector_store_cache.invalidate(index_name)
+        tombstoned_count = len(_tombstoned_ids(storage_name))
+        if VECTOR_STORE_MODE == VectorStoreMode.SHARDED:
+            total = _shard_vector_count(storage_name)
+        else:
+            total = _read_mmap_index(storage_name).ntotal
+    logger.info(f"Tombstoned {len(faiss_ids)} vectors. index_name = {index_name}, content_id = {content_id}")
+    if total and tombstoned_count / total >= VECTOR_INDEX_COMPACTION_RATIO:
+        _start_rebuild(storage_name, compact_index)
+
+def _rebuild_index_like(index, vectors: np.ndarray):
+    """Build an index of the same kind as `index` holding `vectors`, numbered from 0."""
+    faiss = dependable_faiss_import()
+    if not isinstance(index, faiss.IndexFlat) and len(vectors) >= VECTOR_INDEX_PROMOTION_THRESHOLD:
+        index_type = PromotedIndexType.IVF_PQ if isinstance(index, faiss.IndexIVF) else PromotedIndexType.HNSW
+        return _build_approximate_index(vectors, index_type)
+    new_index = faiss.IndexFlatL2(index.d)
+    if len(vectors):
+        new_index.add(vectors)
+    return new_index
+
+def compact_index(index_name: str):
+    """
+    Physically drop tombstoned vectors from the index named `index_name`
+    (a storage name, i.e. a shard in sharded mode) and renumber the rest.
+    The renumbered docstore is written as a new generation, and it is only
+    switched to together with the new index, under the swap lock.
+    """
+    faiss = dependable_faiss_import()
+    try:
+        with _get_index_lock(index_name):
+            tombstoned_ids = _tombstoned_ids(index_name)
+            if not len(tombstoned_ids):
+                return
+            if VECTOR_STORE_MODE == VectorStoreMode.SHARDED:
+                kept_ids = np.setdiff1d(np.arange(_shard_vector_count(index_name), dtype=np.int64), tombstoned_ids)
+                vectors = _read_shard_vectors(index_name, kept_ids)
+                with _get_swap_lock(index_name):
+                    docstore = SQLiteDocstore(_docstore_path(index_name))
+                    try:
+                        docstore.compact(kept_ids)
+                    finally:
+                        docstore.close()
+                    _write_shard_vectors(index_name, vectors, vectors.shape[1])
+                    _clear_tombstones(index_name)
+                logger.info(f"Compact index, Done. index_name = {index_name}, removed = {len(tombstoned_ids)}, kept = {len(kept_ids)}")
+                return
+            index = faiss.read_index(_index_file_path(index_name))
+            kept_ids = np.setdiff1d(np.arange(index.ntotal, dtype=np.int64), tombstoned_ids)
+            vectors = index.reconstruct_batch(kept_ids) if len(kept_ids) else np.empty((0, index.d), dtype=np.float32)
+            new_index = _rebuild_index_like(index, vectors)
+            if VECTOR_STORE_MODE == VectorStoreMode.PICKLE:
+                vector_store = _read_pickle_vector_store(index_name)
+                removed_doc_ids = [vector_store.index_to_docstore_id[int(i)] for i in tombstoned_ids]
+                vector_store.docstore.delete(removed_doc_ids)
+                vector_store.index_to_docstore_id = {
+                    new_id: vector_store.index_to_docstore_id[int(old_id)]
+                    for new_id, old_id in enumerate(kept_ids)
+                }
+                vector_store.index = new_index
+                with _get_swap_lock(index_name):
+                    _persist_vector_store(vector_store, index_name)
+                    _clear_tombstones(index_name)
+            else:
+                with _get_swap_lock(index_name):
+                    docstore = SQLiteDocstore(_docstore_path(index_name))
+                    try:
+                        docstore.compact(kept_ids)
+                    finally:
+                        docstore.close()
+                    _write_index_file(new_index, index_name)
+                    _clear_tombstones(index_name)
+            vector_store_cache.invalidate(index_name)
+        logger.info(f"Compact index, Done. index_name = {index_name}, removed = {len(tombstoned_ids)}, kept = {len(kept_ids)}")
+    except Exception as e:
+        logger.error(f"Compact index failed. index_name = {index_name}, error: {e}")
 
-    FAISS.from_documents(
-        documents=chunks, embedding=_get_embeddings()
-    ).save_local(folder_path=VECTOR_STORE_DIR, index_name=index_name)
\ No newline at end of file
+def migrate_index_to_sqlite(index_name: str):
+    """Move the pickled docstore of an existing index into a SQLite docstore."""
+    with _get_index_lock(index_name):
+        vector_store = _read_pickle_vector_store(index_name)
+        docstore = SQLiteDocstore(_docstore_path(index_name))
+        try:
+            docstore.add({
+                faiss_id: vector_store.docstore.search(doc_id)
+                for faiss_id, doc_id in vector_store.index_to_docstore_id.items()
+            })
+        finally:
+            docstore.close()
+        os.remove(_index_file_path(index_name, "pkl"))
+        vector_store_cache.invalidate(index_name)
@@ -0,0 +1,115 @@
+"""
+Compare the ORM path of the collection listing with the column projection
+used by `/collection/list/get`, on a throwaway SQLite database.
+
+    poetry run python demo/benchmark_collection_list.py [--rows 10000]
+"""
+import argparse, os, statistics, sys, tempfile, time, uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp()
+os.environ["SQL_DATABASE_URL"] = f"sqlite:///{_db_dir}/benchmark.db"
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from app.apis.collection import crud
+from app.apis.schemas import BaseResponse
+from app.db import models
+from app.db.database import SessionLocal, engine
+
+CATEGORIES = 20
+TAGS = 200
+TAGS_PER_COLLECTION = 4
+
+def seed(rows: int) -> str:
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    user = models.User(username="benchmark")
+    session.add(user)
+    session.flush()
+    categories = [models.Category(name=f"category {i}", user_id=user.id) for i in range(CATEGORIES)]
+    tags = [models.Tag(name=f"tag {i}", user_id=user.id) for i in range(TAGS)]
+    session.add_all(categories + tags)
+    session.flush()
+    start = datetime(2024, 1, 1)
+    collection_rows, tag_rows = [], []
+    for i in range(rows):
+        collection_id = str(uuid.uuid4())
+        collection_rows.append({
+            "id": collection_id,
+            "user_id": user.id,
+            "url": f"https://example.com/{i}",
+            "title": f"Article {i}",
+            "description": "A short description of the article." * 2,
+            "thumbnail_url": f"https://example.com/{i}.png",
+            "content": "Body of the article. " * 400,
+            "summary": "Summary of the article. " * 10,
+            "category_id": categories[i % CATEGORIES].id,
+            "created_at": start + timedelta(minutes=i)
+        })
+        tag_rows.extend(
+            {"collection_id": collection_id, "tag_id": tags[(i + j) % TAGS].id}
+            for j in range(TAGS_PER_COLLECTION)
+        )
+    session.execute(models.Collection.__table__.insert(), collection_rows)
+    session.execute(models.collections_tags.insert(), tag_rows)
+    user_id = user.id
+    session.commit()
+    session.close()
+    return user_id
+
+def orm_page(user_id: str, cursor, limit: int) -> bytes:
+    """The listing as served before: ORM objects encoded through the response model."""
+    session = SessionLocal()
+    try:
+        items = crud.get_collections(
+            user_id=user_id,
+            session=session,
+            exclude_fields=["category_id", "content", "user_id"],
+            cursor=cursor,
+            limit=limit + 1
+        )
+        next_cursor = crud.encode_cursor(items[limit - 1]) if len(items) > limit else None
+        response = BaseResponse(code=200, msg="success", data={"items": items[:limit], "next_cursor": next_cursor})
+        return JSONResponse(jsonable_encoder(response)).body
+    finally:
+        session.close()
+
+def projection_page(user_id: str, cursor, limit: int) -> bytes:
+    session = SessionLocal()
+    try:
+        items = crud.get_collection_rows(user_id=user_id, session=session, cursor=cursor, limit=limit + 1)
+        next_cursor = crud.encode_cursor(items[limit - 1]) if len(items) > limit else None
+        return ORJSONResponse(
+            {"code": 200, "msg": "success", "data": {"items": items[:limit], "next_cursor": next_cursor}}
+        ).body
+    finally:
+        session.close()
+
+def timed(page, user_id: str, cursor, limit: int, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        page(user_id, cursor, limit)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    user_id = seed(args.rows)
+    # A cursor in the middle of the listing, to check deep pages cost the same.
+    session = SessionLocal()
+    middle = crud.get_collection_rows(user_id=user_id, session=session, limit=args.rows // 2)[-1]
+    session.close()
+    print(f"{args.rows} collections, median of {args.repeat} requests")
+    print(f"{'page':<18}{'orm ms':>10}{'projection ms':>16}{'speedup':>10}")
+    for limit in (20, 100):
+        for name, cursor in (("first", None), ("middle", crud.encode_cursor(middle))):
+            orm_ms = timed(orm_page, user_id, cursor, limit, args.repeat)
+            projection_ms = timed(projection_page, user_id, cursor, limit, args.repeat)
+            print(f"{name + ' x' + str(limit):<18}{orm_ms:>10.2f}{projection_ms:>16.2f}{orm_ms / projection_ms:>9.1f}x")
@@ -4,6 +4,7 @@ from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
 from alembic import context
+from app.db import fulltext
 from app.db.models import Base
 import os, dotenv
 
@@ -66,6 +67,8 @@ def run_migrations_online() -> None:
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
+    # The full-text triggers call SQL functions defined by the app.
+    fulltext.install(connectable)
 
     with connectable.connect() as connection:
         context.configure(
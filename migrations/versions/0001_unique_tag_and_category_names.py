@@ -0,0 +1,62 @@
+"""unique tag and category names per user
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+Tables are created by `Base.metadata.create_all` at startup, so this first
+revision only adds what `create_all` does not add to existing tables.
+Duplicate names of a user are merged into their oldest row first.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keep the first created row of each (user_id, name).
+    keeper = """
+        SELECT k.id FROM {table} k
+        WHERE k.user_id = {alias}.user_id AND k.name = {alias}.name
+        ORDER BY k.created_at, k.id LIMIT 1
+    """
+    op.execute(f"""
+        UPDATE collections SET category_id = (
+            {keeper.format(table="categories", alias="c")}
+        )
+        FROM categories c
+        WHERE c.id = collections.category_id
+    """)
+    op.execute(f"""
+        INSERT INTO collections_tags (collection_id, tag_id)
+        SELECT DISTINCT ct.collection_id, ({keeper.format(table="tags", alias="t")}) AS keeper_id
+        FROM collections_tags ct JOIN tags t ON t.id = ct.tag_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM collections_tags x
+            WHERE x.collection_id = ct.collection_id
+            AND x.tag_id = ({keeper.format(table="tags", alias="t")})
+        )
+    """)
+    for table in ("tags", "categories"):
+        duplicates = f"""
+            SELECT d.id FROM {table} d
+            WHERE d.id <> ({keeper.format(table=table, alias="d")})
+        """
+        if table == "tags":
+            op.execute(f"DELETE FROM collections_tags WHERE tag_id IN ({duplicates})")
+        op.execute(f"DELETE FROM {table} WHERE id IN ({duplicates})")
+    op.create_index("uq_tags_user_id_name", "tags", ["user_id", "name"], unique=True, if_not_exists=True)
+    op.create_index("uq_categories_user_id_name", "categories", ["user_id", "name"], unique=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("uq_categories_user_id_name", table_name="categories")
+    op.drop_index("uq_tags_user_id_name", table_name="tags")
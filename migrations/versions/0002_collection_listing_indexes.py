@@ -0,0 +1,31 @@
+"""collection listing indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_collections_user_id_created_at", "collections", ["user_id", "created_at", "id"], if_not_exists=True)
+    op.create_index("ix_collections_user_id_category_id", "collections", ["user_id", "category_id"], if_not_exists=True)
+    op.create_index("ix_collections_user_id_url", "collections", ["user_id", "url"], if_not_exists=True)
+    op.create_index("ix_collections_tags_tag_id", "collections_tags", ["tag_id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_collections_tags_tag_id", table_name="collections_tags")
+    op.drop_index("ix_collections_user_id_url", table_name="collections")
+    op.drop_index("ix_collections_user_id_category_id", table_name="collections")
+    op.drop_index("ix_collections_user_id_created_at", table_name="collections")
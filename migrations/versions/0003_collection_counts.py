@@ -0,0 +1,44 @@
+"""collection counts of categories and tags
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table in ["categories", "tags"]:
+        # Databases created by the app's create_all already have the column.
+        if "collection_count" not in {column["name"] for column in inspector.get_columns(table)}:
+            op.add_column(table, sa.Column("collection_count", sa.Integer(), nullable=False, server_default="0"))
+    # Same as `python -m app.db.counters backfill`.
+    op.execute("""
+        UPDATE categories SET collection_count = (
+            SELECT COUNT(*) FROM collections WHERE collections.category_id = categories.id
+        )
+    """)
+    op.execute("""
+        UPDATE tags SET collection_count = (
+            SELECT COUNT(*) FROM collections_tags WHERE collections_tags.tag_id = tags.id
+        )
+    """)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("tags") as batch_op:
+        batch_op.drop_column("collection_count")
+    with op.batch_alter_table("categories") as batch_op:
+        batch_op.drop_column("collection_count")
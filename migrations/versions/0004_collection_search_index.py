@@ -0,0 +1,28 @@
+"""collection full-text search index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.db import fulltext
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The triggers and the backfill call `fts_text`, registered in env.py.
+    fulltext.create(op.get_bind())
+
+
+def downgrade() -> None:
+    fulltext.drop(op.get_bind())
@@ -0,0 +1,74 @@
+import asyncio
+from app.apis.collection.processors import BrowserPool
+
+class _FakeContext:
+    async def route(self, pattern, handler):
+        pass
+
+    async def new_page(self):
+        return object()
+
+    async def close(self):
+        pass
+
+class _FakeBrowser:
+    def __init__(self, launched: list) -> None:
+        self.connected = True
+        launched.append(self)
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self):
+        return _FakeContext()
+
+    async def close(self):
+        self.connected = False
+
+class _FakePlaywright:
+    def __init__(self) -> None:
+        self.launched = []
+        playwright = self
+
+        class _Chromium:
+            async def launch(self, headless):
+                return _FakeBrowser(playwright.launched)
+
+        self.chromium = _Chromium()
+
+    async def stop(self):
+        pass
+
+def _open_browsers(playwright: _FakePlaywright) -> int:
+    return sum(browser.is_connected() for browser in playwright.launched)
+
+def _run_pages(pool: BrowserPool, count: int, concurrent: bool) -> None:
+    async def open_page():
+        async with pool.page():
+            await asyncio.sleep(0)
+
+    async def run():
+        if concurrent:
+            await asyncio.gather(*[open_page() for _ in range(count)])
+        else:
+            for _ in range(count):
+                await open_page()
+
+    asyncio.run(run())
+
+def test_recycled_browsers_are_closed():
+    playwright = _FakePlaywright()
+    pool = BrowserPool(max_concurrency=2, max_pages=3)
+    pool._playwright = playwright
+    _run_pages(pool, 10, concurrent=False)
+    assert len(playwright.launched) == 4
+    assert _open_browsers(playwright) == 1
+
+def test_stop_closes_every_browser():
+    playwright = _FakePlaywright()
+    pool = BrowserPool(max_concurrency=4, max_pages=3)
+    pool._playwright = playwright
+    _run_pages(pool, 10, concurrent=True)
+    assert _open_browsers(playwright) <= 1
+    asyncio.run(pool.stop())
+    assert _open_browsers(playwright) == 0
@@ -0,0 +1,30 @@
+import pytest
+from app.utils import compression
+
+class _CharEncoding:
+    """One token per character, tiktoken needs to download its encodings."""
+
+    def encode(self, text):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+@pytest.fixture(autouse=True)
+def char_tokens(monkeypatch):
+    monkeypatch.setattr(compression, "_get_encoding", lambda model_name: _CharEncoding())
+
+def test_single_paragraph_is_cut_to_sentences():
+    text = "".join(f"这是第{i}句话，内容关于机器学习。" for i in range(600))
+    compressed = compression.compress_content(text, "gpt-3.5-turbo", budget=200)
+    assert compressed
+    assert len(compressed) <= 200 + compressed.count("\n")
+    assert compressed.startswith("这是第0句话")
+
+def test_unsplittable_text_falls_back_to_prefix():
+    text = "a" * 5000
+    assert compression.compress_content(text, "gpt-3.5-turbo", budget=100) == "a" * 100
+
+def test_short_text_is_unchanged():
+    text = "Short article.\nSecond paragraph."
+    assert compression.compress_content(text, "gpt-3.5-turbo", budget=100) == text
@@ -0,0 +1,25 @@
+import asyncio, httpx
+from app.apis.collection import processors
+
+ARTICLE = (
+    '<html><head><meta property="og:title" content="Title"></head>'
+    '<body><div class="rich_media_content">{}</div></body></html>'
+)
+
+class _BrowserlessProcessor(processors.WeChatArticleProcessor):
+    async def _run_browser(self, url):
+        return {"url": url, "content": "from browser"}
+
+def _run(body: str) -> dict:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, text=ARTICLE.format(body))))
+    return asyncio.run(_BrowserlessProcessor(client=client).run_async("https://mp.weixin.qq.com/s/article"))
+
+def test_static_article_is_used():
+    processors.fetch_path_counts.clear()
+    assert _run("<p>Hello</p>")["content"] == "Hello"
+    assert processors.fetch_path_counts == {"static": 1}
+
+def test_empty_static_article_falls_back_to_browser():
+    processors.fetch_path_counts.clear()
+    assert _run("<p> \n </p>")["content"] == "from browser"
+    assert processors.fetch_path_counts == {"static_empty": 1, "browser": 1}